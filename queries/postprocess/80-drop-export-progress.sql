@@ -0,0 +1 @@
+DROP TABLE export_progress;
@@ -1,69 +1,82 @@
 # STL
 import os
-import json
 import asyncio
 import argparse
 from uuid import UUID
 from datetime import datetime
+from collections.abc import Iterable
 
 # PDM
+import orjson
 from gel.errors import EdgeDBError as GelDBError
 
 # LOCAL
 from sonamute.db import MessageDB, format_freq_geldb, load_messagedb_from_env
-from sonamute.cli import SOURCES, menu_handler
-from sonamute.utils import now, fake_uuid, batch_iter, gather_batch, months_in_range
+from sonamute.cli import SOURCES, SourceAction, menu_handler
+from sonamute.utils import (
+    MemoryBudget,
+    now,
+    fake_uuid,
+    batch_iter,
+    adjust_month,
+    months_in_range,
+)
 from sonamute.smtypes import (
     ATTRIBUTE_IDS,
+    Attribute,
     PreMessage,
-    CommSentence,
     GelFrequency,
     StatsCounter,
     SortedSentence,
 )
-from sonamute.counters import countables, process_msg, get_sentence_stats
-from sonamute.constants import MAX_TERM_LEN, MIN_HITS_NEEDED
+from sonamute.counters import (
+    countables,
+    process_msg,
+    get_sentence_stats,
+    parallel_sentence_stats,
+)
+from sonamute.constants import MAX_TERM_LEN, FREQ_MAX_SENTS, MIN_HITS_NEEDED
 from sonamute.gen_sqlite import generate_sqlite
-from sonamute.sources.generic import PlatformFetcher
+from sonamute.sources.generic import FileFetcher, PlatformFetcher
 
 
-async def insert_raw_msg(db: MessageDB, msg: PreMessage) -> UUID | None:
-    if await db.message_in_db(msg):
-        return
+async def insert_raw_msg(
+    db: MessageDB,
+    msg: PreMessage,
+    db_limit: asyncio.Semaphore,
+) -> UUID | None:
+    async with db_limit:
+        if await db.message_in_db(msg):
+            return
 
     processed = process_msg(msg)
     try:
-        _ = await db.insert_message(processed)
+        async with db_limit:
+            _ = await db.insert_message(processed)
     except GelDBError as e:
         print(msg)
         raise (e)
 
 
-def sort_by_community(
-    tagged_sents: list[CommSentence],
-) -> dict[UUID, list[SortedSentence]]:
-    output: dict[UUID, list[SortedSentence]] = dict()
-    for s in tagged_sents:
-        if s["community"] not in output:
-            output[s["community"]] = list()
-        output[s["community"]].append({"words": s["words"], "author": s["author"]})
-    return output
-
-
-async def source_to_db(db: MessageDB, source: PlatformFetcher, batch_size: int):
+async def source_to_db(
+    db: MessageDB,
+    source: PlatformFetcher,
+    name: str,
+    batch_size: int,
+    db_limit: asyncio.Semaphore,
+):
     i = 0
-    for batch in batch_iter(source.get_messages(), batch_size):
-        inserts = [insert_raw_msg(db, msg) for msg in batch]
+    batches = batch_iter(source.get_messages(), batch_size)
+    # files are read in a thread, so other sources can insert meanwhile
+    while batch := await asyncio.to_thread(next, batches, None):
+        inserts = [insert_raw_msg(db, msg, db_limit) for msg in batch]
         _ = await asyncio.gather(*inserts)
 
         i += len(inserts)
         if i % (batch_size * 100) == 0:
-            print(f"Processed {i} messages @ {now()}")
+            print(f"Processed {i} {name} messages @ {now()}")
 
-    print("Calculating tpt sentences per author...")
-    await db.update_author_tpt_sents()
-
-    print(f"Final total: {i} messages @ {now()}")
+    print(f"Final total: {i} {name} messages @ {now()}")
 
 
 def format_stats(
@@ -93,49 +106,207 @@ def format_stats(
     return output
 
 
-async def db_sents_to_freqs(db: MessageDB, batch_size: int, passing: bool):
-    first_msg_dt, last_msg_dt = await db.get_msg_date_range()
-    for start, end in months_in_range(first_msg_dt, last_msg_dt):
-        print(f"gen frequency for {start.date()} - {end.date()} @ {now()}")
-        result = await db.counted_sents_in_range(start, end, passing)
-        by_community = sort_by_community(result)
-        # NOTE: community is used behind the scenes; it's probably too
-        # identifying and too much to deliver, but i can still derive useful
-        # things from it
-
-        for community, sents in by_community.items():
-            stats = get_sentence_stats(sents, MAX_TERM_LEN)
-            formatted = format_stats(stats, community, start)
-            _ = await gather_batch(db.insert_frequency, formatted, batch_size)
-
+async def month_sents_to_freqs(
+    db: MessageDB,
+    passing: bool,
+    start: datetime,
+    end: datetime,
+    communities: list[UUID] | None = None,
+):
+    print(f"gen frequency for {start.date()} - {end.date()} @ {now()}")
+    by_community = db.community_sents_in_range(start, end, passing, communities)
+    # NOTE: community is used behind the scenes; it's probably too
+    # identifying and too much to deliver, but i can still derive useful
+    # things from it
+
+    async for community, _, sents in by_community:
+        stats = get_sentence_stats(sents, MAX_TERM_LEN)
+        formatted = format_stats(stats, community, start)
+        await db.insert_frequencies(formatted)
+
+
+async def pipelined_sents_to_freqs(
+    db: MessageDB,
+    passing: bool,
+    months: list[tuple[datetime, datetime, list[UUID] | None]],
+    workers: int,
+    max_sents: int,
+):
+    """
+    Fetch, count, and write community-months concurrently, so the next month is
+    being fetched while the current one is counted and the last one is written.
+    At most `max_sents` sentences are in flight at once, from fetch until their
+    frequencies are written.
+
+    Only this task adds to each Term's total hits, once every writer is done,
+    since the writers would all conflict on the most used terms.
+    """
+    budget = MemoryBudget(max_sents)
+    to_count: asyncio.Queue[
+        tuple[UUID, datetime, int, Iterable[SortedSentence]] | None
+    ] = asyncio.Queue(workers)
+    to_write: asyncio.Queue[tuple[list[GelFrequency], int] | None] = asyncio.Queue(
+        workers
+    )
 
-def source_sents_to_freqs(source: PlatformFetcher) -> list[GelFrequency]:
-    stats = get_sentence_stats(countables(source), MAX_TERM_LEN)
-    stats = format_stats(stats)
-    return stats
+    async def fetch():
+        for start, end, communities in months:
+            print(f"gen frequency for {start.date()} - {end.date()} @ {now()}")
+            if communities is not None:
+                await db.delete_freqs(communities, start)
+            by_community = db.community_sents_in_range(start, end, passing, communities)
+            async for community, size, sents in by_community:
+                size = await budget.acquire(size)
+                await to_count.put((community, start, size, sents))
+        for _ in range(workers):
+            await to_count.put(None)
+
+    async def count():
+        while item := await to_count.get():
+            community, start, size, sents = item
+            # counting is pure python; a thread at least lets db io continue
+            stats = await asyncio.to_thread(get_sentence_stats, sents, MAX_TERM_LEN)
+            formatted = format_stats(stats, community, start)
+            await to_write.put((formatted, size))
 
+    async def count_all():
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(workers):
+                _ = tg.create_task(count())
+        for _ in range(workers):
+            await to_write.put(None)
 
-def filter_freqs(freqs: list[GelFrequency], min_val: int) -> list[GelFrequency]:
-    freqs = [f for f in freqs if f["hits"] >= min_val]
-    return freqs
+    term_hits: dict[UUID, int] = dict()
 
+    async def write():
+        while item := await to_write.get():
+            formatted, size = item
+            await db.insert_frequencies(formatted, term_hits=term_hits)
+            await budget.release(size)
 
-def prep_for_dump(stats: list[GelFrequency]) -> list[GelFrequency]:
-    for f in stats:
-        f["authors"] = len(f["authors"])  # full set would be nonsense
-        f["attr"] = ATTRIBUTE_IDS[f["attr"]]  # can't serialize enum
-        del f["day"]  # not easy to organize
-        del f["community"]  # doesn't do anything
+    try:
+        async with asyncio.TaskGroup() as tg:
+            _ = tg.create_task(fetch())
+            _ = tg.create_task(count_all())
+            for _ in range(workers):
+                _ = tg.create_task(write())
+    finally:
+        # even on failure, so the totals match the frequencies written so far
+        print(f"Adding hits of {len(term_hits)} terms to their totals @ {now()}")
+        await db.update_term_hits(term_hits)
+
+
+async def db_sents_to_freqs(
+    db: MessageDB,
+    passing: bool,
+    workers: int = 1,
+    max_sents: int = FREQ_MAX_SENTS,
+):
+    first_msg_dt, last_msg_dt = await db.get_msg_date_range()
+    if workers > 1:
+        months = [
+            (start, end, None)
+            for start, end in months_in_range(first_msg_dt, last_msg_dt)
+        ]
+        await pipelined_sents_to_freqs(db, passing, months, workers, max_sents)
+    else:
+        for start, end in months_in_range(first_msg_dt, last_msg_dt):
+            await month_sents_to_freqs(db, passing, start, end)
+    # everything was just counted, so nothing is dirty anymore
+    await db.clear_dirty_months()
+
+
+async def dirty_sents_to_freqs(
+    db: MessageDB,
+    passing: bool,
+    workers: int = 1,
+    max_sents: int = FREQ_MAX_SENTS,
+):
+    """Recount only the (community, month) buckets which received new sentences
+    since the last frequency generation, replacing their old frequencies."""
+    dirty = await db.select_dirty_months()
+    print(f"Found {sum(len(c) for c in dirty.values())} dirty community-months")
+    if workers > 1:
+        months = [
+            (start, adjust_month(start, 1), communities)
+            for start, communities in dirty.items()
+        ]
+        await pipelined_sents_to_freqs(db, passing, months, workers, max_sents)
+        for start, communities in dirty.items():
+            await db.clear_dirty_months(communities, start)
+        return
 
-    stats.sort(
-        key=lambda f: (
-            f["term_len"],  # 1 to n
-            f["attr"],  # one for each Attribute member
-            -f["hits"],  # highest to lowest
-            -f["authors"],  # again highest to lowest
-        )
-    )
-    return stats
+    for start, communities in dirty.items():
+        end = adjust_month(start, 1)
+        await db.delete_freqs(communities, start)
+        await month_sents_to_freqs(db, passing, start, end, communities)
+        await db.clear_dirty_months(communities, start)
+
+
+def source_sents_to_stats(source: PlatformFetcher, workers: int = 1) -> StatsCounter:
+    if workers > 1 and isinstance(source, FileFetcher):
+        return parallel_sentence_stats(source, MAX_TERM_LEN, workers)
+    return get_sentence_stats(countables(source), MAX_TERM_LEN)
+
+
+def dump_stats(stats: StatsCounter, output: str, min_hits: int):
+    """
+    Write `stats` to `output` as a JSON array, one term per line, sorted by
+    term_len, then attr, then most hits and authors first.
+
+    Rows are written a (term_len, attr) group at a time, so only that group's
+    keys are sorted and held beyond the counter itself.
+    """
+    groups: dict[tuple[int, int], list[tuple[int, str, Attribute]]] = dict()
+    for key, item in stats.items():
+        if item["hits"] < min_hits:
+            continue
+        term_len, _, attr = key
+        groups.setdefault((term_len, ATTRIBUTE_IDS[attr]), []).append(key)
+
+    with open(output, "wb") as f:
+        _ = f.write(b"[")
+        first = True
+        for term_len, attr_id in sorted(groups):
+            keys = groups.pop((term_len, attr_id))
+            keys.sort(key=lambda k: (-stats[k]["hits"], -len(stats[k]["authors"])))
+            for key in keys:
+                row = {
+                    "text": key[1],
+                    "term_len": term_len,
+                    "attr": attr_id,
+                    "hits": stats[key]["hits"],
+                    "authors": len(stats[key]["authors"]),  # full set would be nonsense
+                }
+                _ = f.write(b"\n" if first else b",\n")
+                _ = f.write(orjson.dumps(row))
+                first = False
+        _ = f.write(b"\n]\n")
+
+
+async def run_source(
+    db: MessageDB,
+    sourcedata: SourceAction,
+    batch_size: int,
+    db_limit: asyncio.Semaphore,
+):
+    platform = sourcedata["source"]
+    root = sourcedata["root"]
+    to_db = sourcedata["to_db"]
+    output = sourcedata["output"]
+
+    source = SOURCES[platform](root)
+
+    print(f"Fetching {platform} data from {root}")
+    if to_db:
+        batch_size = sourcedata.get("batch_size", batch_size)
+        await source_to_db(db, source, platform, batch_size, db_limit)
+    else:
+        assert output  # cli guarantees it exists
+        workers = sourcedata.get("workers", 1)
+        stats = await asyncio.to_thread(source_sents_to_stats, source, workers)
+        await asyncio.to_thread(dump_stats, stats, output, MIN_HITS_NEEDED)
+        print(f"Wrote {platform} data to {output}")
 
 
 async def amain(argv: argparse.Namespace):
@@ -143,30 +314,26 @@ async def amain(argv: argparse.Namespace):
 
     batch_size: int = argv.batch_size
     db = load_messagedb_from_env()
-    for sourcedata in actions["sources"]:
-        platform = sourcedata["source"]
-        root = sourcedata["root"]
-        to_db = sourcedata["to_db"]
-        output = sourcedata["output"]
-
-        source = SOURCES[platform](root)
-
-        print(f"Fetching {platform} data from {root}")
-        if to_db:
-            await source_to_db(db, source, batch_size)
+    # shared by every source, so running them at once can't flood the db
+    db_limit = asyncio.Semaphore(argv.db_concurrency)
+    sources = actions["sources"]
+    # one failing source cancels the rest, and every failure is raised
+    async with asyncio.TaskGroup() as tg:
+        for sourcedata in sources:
+            _ = tg.create_task(run_source(db, sourcedata, batch_size, db_limit))
+    if any(sourcedata["to_db"] for sourcedata in sources):
+        print("Calculating tpt sentences per author...")
+        await db.update_author_tpt_sents()
+
+    if frequency := actions["frequency"]:
+        workers = frequency["workers"]
+        max_sents = frequency["max_sents"]
+        if frequency["incremental"]:
+            print("Regenerating frequency data for new months")
+            await dirty_sents_to_freqs(db, True, workers, max_sents)
         else:
-            assert output  # cli guarantees it exists
-            stats = source_sents_to_freqs(source)
-            stats = filter_freqs(stats, MIN_HITS_NEEDED)
-            stats = prep_for_dump(stats)
-            # TODO: new function to dump these in a sensible way
-            dumped = json.dumps(stats, indent=2, ensure_ascii=False)
-            with open(output, "w") as f:
-                _ = f.write(dumped)
-
-    if actions["frequency"]:
-        print("Regenerating frequency data")
-        await db_sents_to_freqs(db, batch_size, True)
+            print("Regenerating frequency data")
+            await db_sents_to_freqs(db, True, workers, max_sents)
 
     if actions["sqlite"]:
         root = actions["sqlite"]["root"]
@@ -175,6 +342,15 @@ async def amain(argv: argparse.Namespace):
         trimmed_filename = actions["sqlite"]["filename_trimmed"]
         min_date = actions["sqlite"]["min_date"]
         max_date = actions["sqlite"]["max_date"]
+        rollup = actions["sqlite"]["rollup"]
+        workers = actions["sqlite"]["workers"]
+        rank_size = actions["sqlite"]["rank_size"]
+        term_search = actions["sqlite"]["term_search"]
+        series = actions["sqlite"]["series"]
+        parquet_dir = actions["sqlite"]["parquet_dir"]
+        sorted_load = actions["sqlite"]["sorted_load"]
+        since = actions["sqlite"]["since"]
+        httpvfs_dir = actions["sqlite"]["httpvfs_dir"]
 
         print(f"Dumping frequency data to {dbpath}")
         await generate_sqlite(
@@ -184,6 +360,15 @@ async def amain(argv: argparse.Namespace):
             min_date,
             max_date,
             MAX_TERM_LEN,
+            rollup,
+            workers,
+            sorted_load,
+            since,
+            httpvfs_dir,
+            rank_size,
+            term_search,
+            series,
+            parquet_dir,
         )
 
 
@@ -201,5 +386,13 @@ if __name__ == "__main__":
         type=int,
         default=150,
     )
+    _ = parser.add_argument(
+        "--db-concurrency",
+        help="Most queries to send to the database at once, across all sources.",
+        dest="db_concurrency",
+        required=False,
+        type=int,
+        default=150,
+    )
     ARGV = parser.parse_args()
     main(ARGV)
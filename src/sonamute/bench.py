@@ -0,0 +1,140 @@
+# STL
+import os
+import sys
+import json
+import argparse
+from typing import TypedDict
+
+# LOCAL
+from sonamute.httpvfs import REPORT_SAMPLES, sample_terms
+from sonamute.site_queries import query_params, applicable_queries
+
+# fail when a query reads this much more than its baseline, as a fraction
+REGRESSION_THRESHOLD = 0.1
+
+
+class BenchResult(TypedDict):
+    # means over every sampled term
+    pages: float
+    bytes: float
+    seconds: float
+
+
+def run_benchmark(
+    filename: str,
+    samples: int = REPORT_SAMPLES,
+) -> dict[str, BenchResult]:
+    """
+    Run every applicable query in `SITE_QUERIES` against `filename` for sampled
+    terms, each on a cold connection, counting what it reads.
+
+    Needs `apsw`, from the `httpvfs` optional dependencies.
+    """
+    # LOCAL
+    from sonamute.pagecount import PageCountVFS, measure_query
+
+    vfs = PageCountVFS("bench")
+    params = [query_params(text) for text in sample_terms(filename, samples)]
+    results: dict[str, BenchResult] = dict()
+    for name, query in applicable_queries(filename).items():
+        reads = [measure_query(vfs, filename, query, p) for p in params]
+        n = max(len(reads), 1)
+        results[name] = {
+            "pages": sum(len(r["pages"]) for r in reads) / n,
+            "bytes": sum(r["bytes"] for r in reads) / n,
+            "seconds": sum(r["seconds"] for r in reads) / n,
+        }
+    vfs.unregister()
+    return results
+
+
+def find_regressions(
+    results: dict[str, BenchResult],
+    baseline: dict[str, BenchResult],
+    threshold: float = REGRESSION_THRESHOLD,
+) -> list[str]:
+    """
+    Describe every query reading more pages or bytes than its baseline allows.
+
+    Latency is only reported, since it depends on the machine more than the
+    export; queries missing from either side are ignored.
+    """
+    regressions: list[str] = list()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for measure in ("pages", "bytes"):
+            limit = baseline[name][measure] * (1 + threshold)
+            if result[measure] > limit:
+                regressions.append(
+                    f"{name}: {result[measure]:.1f} {measure}, "
+                    f"over {baseline[name][measure]:.1f} by more than {threshold:.0%}"
+                )
+    return regressions
+
+
+def print_results(results: dict[str, BenchResult]):
+    for name, result in results.items():
+        print(
+            f"{name}: {result['pages']:.1f} pages, {result['bytes']:.0f} bytes, "
+            f"{result['seconds'] * 1000:.2f}ms"
+        )
+
+
+def main(argv: argparse.Namespace) -> int:
+    results = run_benchmark(argv.database, argv.samples)
+    print_results(results)
+
+    if argv.save:
+        with open(argv.save, "w") as f:
+            _ = f.write(json.dumps(results, indent=2))
+
+    if argv.baseline:
+        with open(argv.baseline, "r") as f:
+            baseline = json.loads(f.read())
+        regressions = find_regressions(results, baseline, argv.threshold)
+        for regression in regressions:
+            print(f"Regression in {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+
+    def existing_file(file_path: str) -> str:
+        if os.path.isfile(file_path):
+            return file_path
+        raise FileNotFoundError(file_path)
+
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "database",
+        help="Exported SQLite database to benchmark",
+        type=existing_file,
+    )
+    _ = parser.add_argument(
+        "--baseline",
+        help="Results saved from an earlier run to compare against",
+        type=existing_file,
+    )
+    _ = parser.add_argument(
+        "--save",
+        help="File to save these results to, for use as a baseline",
+    )
+    _ = parser.add_argument(
+        "--threshold",
+        help="Fraction over the baseline's pages or bytes to fail at",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+    )
+    _ = parser.add_argument(
+        "--samples",
+        help="How many terms to run each query for",
+        type=int,
+        default=REPORT_SAMPLES,
+    )
+
+    argv = parser.parse_args()
+
+    sys.exit(main(argv))
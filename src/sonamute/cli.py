@@ -1,7 +1,7 @@
 # STL
 import os
 import sys
-from typing import Any, TypedDict, cast
+from typing import Any, TypedDict, NotRequired, cast
 from datetime import UTC, date, tzinfo, datetime
 
 # PDM
@@ -11,6 +11,7 @@ from rich.prompt import Prompt, Confirm, IntPrompt
 from rich.console import Console
 
 # LOCAL
+from sonamute.constants import RANK_SIZE, FREQ_MAX_SENTS
 from sonamute.sources.poki import PokiLapoFetcher
 from sonamute.sources.forum import ForumFetcher
 from sonamute.sources.reddit import RedditFetcher
@@ -36,6 +37,10 @@ class SourceAction(TypedDict):
     root: str
     to_db: bool
     output: str | None
+    # processes to count with, when not sending to the db
+    workers: NotRequired[int]
+    # messages to insert at once when sending to the db, over --batch-size
+    batch_size: NotRequired[int]
 
 
 class SqliteAction(TypedDict):
@@ -44,15 +49,30 @@ class SqliteAction(TypedDict):
     min_date: datetime
     max_date: datetime
     root: str
+    rollup: bool
+    workers: int
+    rank_size: int
+    term_search: bool
+    series: bool
+    parquet_dir: str | None
+    sorted_load: bool
+    since: datetime | None
+    httpvfs_dir: str | None
+
+
+class FrequencyAction(TypedDict):
+    incremental: bool
+    workers: int
+    max_sents: int
 
 
 class Actions(TypedDict):
     sources: list[SourceAction]
-    frequency: bool
+    frequency: FrequencyAction | None
     sqlite: SqliteAction | None
 
 
-ACTIONS: Actions = {"sources": [], "frequency": False, "sqlite": None}
+ACTIONS: Actions = {"sources": [], "frequency": None, "sqlite": None}
 
 
 def today_str():
@@ -137,14 +157,17 @@ def setup_one_source():
     to_db = Confirm.ask("Send to database?")
 
     output = None
+    workers = 1
     if not to_db:
         output = get_filename("Output where?", default=f"./{source}_{today_str()}.json")
+        workers = IntPrompt.ask("How many processes to count with?", default=1)
     result = SourceAction(
         {
             "source": source,
             "root": dir,
             "to_db": to_db,
             "output": output,
+            "workers": workers,
         }
     )
     add_source(result)
@@ -159,8 +182,24 @@ def setup_sources():
 
 
 def setup_frequency():
-    ACTIONS["frequency"] = True
-    CONSOLE.print("Will regenerate frequency data on next run")
+    incremental = Confirm.ask("Only regenerate months with new data?")
+    workers = IntPrompt.ask("How many community-months to process at once?", default=1)
+    max_sents = FREQ_MAX_SENTS
+    if workers > 1:
+        max_sents = IntPrompt.ask(
+            "Most sentences to hold in memory at once?", default=FREQ_MAX_SENTS
+        )
+    ACTIONS["frequency"] = FrequencyAction(
+        {
+            "incremental": incremental,
+            "workers": workers,
+            "max_sents": max_sents,
+        }
+    )
+    if incremental:
+        CONSOLE.print("Will regenerate frequency data for new months on next run")
+    else:
+        CONSOLE.print("Will regenerate frequency data on next run")
 
 
 def setup_sqlite():
@@ -168,6 +207,33 @@ def setup_sqlite():
     location = get_directory("Save to where?", default=".")
     min_date = get_date("Minimum date? YYYY-MM", format="%Y-%m", default="2001-08")
     max_date = get_date("Maximum date? YYYY-MM", format="%Y-%m", default="2025-08")
+    rollup = Confirm.ask("Derive yearly and all time data from monthly data?")
+    workers = IntPrompt.ask(
+        "How many periods to read from the database at once?", default=4
+    )
+    rank_size = IntPrompt.ask(
+        "How many top terms to rank for each period?", default=RANK_SIZE
+    )
+    term_search = Confirm.ask("Index terms for infix and suffix wildcard search?")
+    series = Confirm.ask("Pack each term's monthly data into a single row?")
+    parquet_dir = None
+    if Confirm.ask("Also write the data as parquet? Needs pyarrow"):
+        parquet_dir = get_directory("Write parquet to where?", default="parquet")
+    sorted_load = Confirm.ask(
+        "Stage frequency data and load it in primary key order?", default=False
+    )
+    since = None
+    if rollup:
+        # exports keep author counts, not the authors, so yearly and all time
+        # can only be merged again from every month in the database
+        CONSOLE.print(
+            "Rollup exports can't be updated in place; all time data needs every month"
+        )
+    elif Confirm.ask("Update an existing export instead of making a new one?"):
+        since = get_date("Update from which month? YYYY-MM", format="%Y-%m")
+    httpvfs_dir = None
+    if Confirm.ask("Lay out and chunk the trimmed database for sql.js-httpvfs?"):
+        httpvfs_dir = get_directory("Write chunks to where?", default="chunks")
 
     full_filename = filename + "-full.sqlite"
     trimmed_filename = filename + "-trimmed.sqlite"
@@ -179,6 +245,15 @@ def setup_sqlite():
             "min_date": min_date,
             "max_date": max_date,
             "root": location,
+            "rollup": rollup,
+            "workers": workers,
+            "rank_size": rank_size,
+            "term_search": term_search,
+            "series": series,
+            "parquet_dir": parquet_dir,
+            "sorted_load": sorted_load,
+            "since": since,
+            "httpvfs_dir": httpvfs_dir,
         }
     )
     CONSOLE.print(
@@ -196,8 +271,11 @@ def display_choices():
                 f"Sending {source['source']} data from {source['root']} to {dest}"
             )
 
-    if ACTIONS["frequency"]:
-        CONSOLE.print("Regenerating frequency data from database")
+    if frequency := ACTIONS["frequency"]:
+        if frequency["incremental"]:
+            CONSOLE.print("Regenerating frequency data for new months from database")
+        else:
+            CONSOLE.print("Regenerating frequency data from database")
 
     if sqlite := ACTIONS["sqlite"]:
         path = os.path.join(sqlite["root"], sqlite["filename"])
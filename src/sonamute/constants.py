@@ -38,3 +38,9 @@ MAX_TERM_LEN = 6
 MIN_HITS_NEEDED = 40
 MIN_SENTS_NEEDED = 20
 LONG_SENTENCE_LEN = 4
+
+# most sentences held in memory at once while generating frequencies concurrently
+FREQ_MAX_SENTS = 2_000_000
+
+# top terms ranked for each term length, attr, and period in the sqlite export
+RANK_SIZE = 100
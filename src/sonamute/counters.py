@@ -1,11 +1,13 @@
 # STL
 import math
 import itertools
+import multiprocessing
 from sys import intern
 from uuid import UUID
-from typing import Tuple, TypeVar
+from typing import Tuple, TypeVar, Callable
 from collections import Counter, defaultdict
-from collections.abc import Iterable, Iterator, Generator
+from collections.abc import Hashable, Iterable, Iterator, Generator, Collection
+from concurrent.futures import ProcessPoolExecutor
 
 # LOCAL
 from sonamute.ilo import ILO
@@ -20,7 +22,7 @@ from sonamute.smtypes import (
     SortedSentence,
 )
 from sonamute.constants import LONG_SENTENCE_LEN
-from sonamute.sources.generic import PlatformFetcher, is_countable
+from sonamute.sources.generic import FileFetcher, PlatformFetcher, is_countable
 
 T = TypeVar("T")
 
@@ -29,6 +31,10 @@ AVG_SENT_LEN = 4.13557
 AVG_SENT_LEN_5X = math.ceil(5 * AVG_SENT_LEN)
 AVG_SENT_LEN_25X = math.ceil(25 * AVG_SENT_LEN)
 
+# files are split into this many runs per worker, so one slow run doesn't
+# leave the other workers idle at the end
+CHUNKS_PER_WORKER = 4
+
 MED_SENT_LEN = 3
 MED_SENT_LEN_5X = 5 * MED_SENT_LEN
 MED_SENT_LEN_25X = 25 * MED_SENT_LEN
@@ -118,6 +124,16 @@ def process_msgs(msgs: Iterable[PreMessage]) -> Generator[Message, None, None]:
         yield msg
 
 
+def unseen(
+    msgs: Iterable[PreMessage],
+    seen: Collection[Hashable],
+    seen_key: Callable[[PreMessage], Hashable],
+) -> Generator[PreMessage, None, None]:
+    for msg in msgs:
+        if seen_key(msg) not in seen:
+            yield msg
+
+
 def counted(msgs: Iterable[Message]) -> Generator[Message, None, None]:
     for msg in msgs:
         if msg["is_counted"]:
@@ -157,10 +173,12 @@ def lowered(
 
 def countables(
     source: PlatformFetcher,
+    seen: Collection[Hashable] = frozenset(),
 ) -> Generator[SortedSentence, None, None]:
 
     # why did i write this
     msgs = source.get_messages()
+    msgs = unseen(msgs, seen, source.seen_key)
     msgs = process_msgs(msgs)
     msgs = counted(msgs)
     sents = sentences_of(msgs)
@@ -258,3 +276,85 @@ def get_sentence_stats(
                     add_freq(term_len, term, Attribute.Short, author)
 
     return freqs
+
+
+def merge_stats(into: StatsCounter, partial: StatsCounter):
+    """Add each term of `partial` to `into`, summing hits and joining authors."""
+    for key, item in partial.items():
+        if key not in into:
+            into[key] = item
+            continue
+        into[key]["hits"] += item["hits"]
+        into[key]["authors"] |= item["authors"]
+
+
+def message_ids(
+    fetcher: type[FileFetcher],
+    root: str,
+    paths: list[str],
+) -> list[Hashable]:
+    """The key each message in `paths` is deduplicated by; see `seen_key`."""
+    source = fetcher(root, paths)
+    return [source.seen_key(msg) for msg in source.get_messages()]
+
+
+def count_paths(
+    fetcher: type[FileFetcher],
+    root: str,
+    paths: list[str],
+    max_term_len: int,
+    seen: set[Hashable],
+) -> StatsCounter:
+    source = fetcher(root, paths)
+    stats = get_sentence_stats(countables(source, seen), max_term_len)
+    return dict(stats)  # the defaultdict's factory can't be pickled back
+
+
+def parallel_sentence_stats(
+    source: FileFetcher,
+    max_term_len: int,
+    workers: int,
+) -> StatsCounter:
+    """
+    Count `source` across `workers` processes, each counting a run of its files,
+    then merge their counts in file order.
+
+    The result is the same as `get_sentence_stats(countables(source), ...)`.
+    A message may appear in several files, so the workers first list the keys
+    of the messages in their runs, and each run then skips the keys an earlier
+    run has, just as a single fetcher skips messages it has seen. This reads
+    every file twice.
+    """
+    paths = list(source.walk())
+    size = max(math.ceil(len(paths) / (workers * CHUNKS_PER_WORKER)), 1)
+    chunks = [paths[i : i + size] for i in range(0, len(paths), size)]
+
+    stats: StatsCounter = dict()
+    # forking while other sources run in threads can copy their held locks
+    context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        chunk_ids = executor.map(
+            message_ids,
+            itertools.repeat(type(source)),
+            itertools.repeat(source.root),
+            chunks,
+        )
+        claimed: set[Hashable] = set()
+        # only the keys a run shares with earlier runs, to keep them small
+        seen: list[set[Hashable]] = []
+        for ids in chunk_ids:
+            seen.append(claimed.intersection(ids))
+            claimed.update(ids)
+        del claimed
+
+        partials = executor.map(
+            count_paths,
+            itertools.repeat(type(source)),
+            itertools.repeat(source.root),
+            chunks,
+            itertools.repeat(max_term_len),
+            seen,
+        )
+        for partial in partials:
+            merge_stats(stats, partial)
+    return stats
@@ -1,18 +1,20 @@
 # STL
 from uuid import UUID
 from typing import Any, Iterable, cast
-from datetime import datetime
+from datetime import UTC, datetime
+from collections import defaultdict
+from collections.abc import Generator, AsyncGenerator
 
 # PDM
 import gel
+import orjson
 from gel import RetryOptions, AsyncIOClient, IsolationLevel, TransactionOptions
 from async_lru import alru_cache
 
 # LOCAL
-from sonamute.utils import load_envvar
+from sonamute.utils import batch_iter, load_envvar, adjust_month
 from sonamute.smtypes import (
     ATTRIBUTE_IDS,
-    Stats,
     Author,
     Message,
     Platform,
@@ -20,12 +22,16 @@ from sonamute.smtypes import (
     Attribute,
     Community,
     PreMessage,
-    CommSentence,
     GelFrequency,
+    IndexedStats,
     SQLFrequency,
+    SortedSentence,
 )
 from sonamute.constants import MIN_HITS_NEEDED, MIN_SENTS_NEEDED
 
+# frequencies per insert; each row is small, but its authors list is not
+FREQ_BATCH = 2500
+
 
 def create_client(username: str, password: str, host: str, port: int) -> AsyncIOClient:
     client = gel.create_async_client(
@@ -61,9 +67,9 @@ MSG_SELECT = """
 select Message filter ._id = <bigint>$_id and .community = <Community>$community
 """
 
-# author := .message.author.id,
 USER_SENTS_SELECT = """
-SELECT %s { community := .message.community.id, author := .message.author.id, words } FILTER
+SELECT %s { author := .message.author.id, words } FILTER
+    .message.community.id = <uuid>$community AND
     .message.postdate >= <std::datetime>$start AND
     .message.postdate < <std::datetime>$end
 """
@@ -75,20 +81,68 @@ FAILING_USER_SENTS_SELECT = USER_SENTS_SELECT % "NonTPUserSentence"
 # "invested", but for actual occurrence of terms, this would omit a fairly large
 # number of sentences- around 50k authors speak between 1 and 19 sentences.
 
+SENT_COMMUNITIES_SELECT = """
+WITH sents := (
+    SELECT %s FILTER
+        .message.postdate >= <std::datetime>$start AND
+        .message.postdate < <std::datetime>$end
+)
+SELECT sents.message.community.id
+"""
+PASSING_SENT_COMMUNITIES_SELECT = SENT_COMMUNITIES_SELECT % "TPUserSentence"
+FAILING_SENT_COMMUNITIES_SELECT = SENT_COMMUNITIES_SELECT % "NonTPUserSentence"
+
+# grouped in the db so author sets never leave it; authors are only counted
+# once they've spoken enough sentences, see MIN_SENTS_NEEDED
 TERM_DATA_SELECT = """
-select Frequency {text := .term.text, hits := .hits, authors := .authors}
-filter
-    .term.total_hits >= %s
-    and .term.len = <int16>$term_len
-    and .attr = <Attribute>$attr
-    and .day >= <std::datetime>$start
-    and .day < <std::datetime>$end;
+with
+  F := (
+    select Frequency
+    filter
+      .term.total_hits >= %s
+      and .term.len = <int16>$term_len
+      and .attr = <Attribute>$attr
+      and .day >= <std::datetime>$start
+      and .day < <std::datetime>$end
+  ),
+  groups := (group F using text := .term.text by text)
+select groups {
+  text := .key.text,
+  hits := sum(.elements.hits),
+  authors := count((select .elements.authors filter .num_tp_sentences >= %s)),
+};
 """ % (
-    MIN_HITS_NEEDED
+    MIN_HITS_NEEDED,
+    MIN_SENTS_NEEDED,
 )
 
-AUTHOR_IS_COUNTED_SELECT = """
-    select Author filter .id = <std::uuid>$author and .num_tp_sentences >= %s;
+# as above, but returns the counted authors themselves so ranges can be merged
+TERM_AUTHORS_DATA_SELECT = """
+with
+  F := (
+    select Frequency
+    filter
+      .term.total_hits >= %s
+      and .term.len = <int16>$term_len
+      and .attr = <Attribute>$attr
+      and .day >= <std::datetime>$start
+      and .day < <std::datetime>$end
+  ),
+  groups := (group F using text := .term.text by text)
+select groups {
+  text := .key.text,
+  hits := sum(.elements.hits),
+  authors := array_agg(
+    (select .elements.authors filter .num_tp_sentences >= %s).id
+  ),
+};
+""" % (
+    MIN_HITS_NEEDED,
+    MIN_SENTS_NEEDED,
+)
+
+COUNTED_AUTHORS_SELECT = """
+    select (select Author filter .num_tp_sentences >= %s).id;
 """ % (
     MIN_SENTS_NEEDED
 )
@@ -119,11 +173,12 @@ with
       and .day >= <std::datetime>$start
       and .day < <std::datetime>$end
   )
-  select F.authors;
+  select count((select F.authors filter .num_tp_sentences >= %s));
 """ % (
-    MIN_HITS_NEEDED
+    MIN_HITS_NEEDED,
+    MIN_SENTS_NEEDED,
 )
-# this is distinct by default. insane. love it.
+# F.authors is distinct by default. insane. love it.
 
 PLAT_INSERT = """
 INSERT Platform {
@@ -180,46 +235,103 @@ INSERT Term {
 else .
 """
 
-FREQ_INSERT = """
-INSERT Frequency {
-    term := (
+TERMS_SELECT = """
+select Term { text }
+"""
+
+# terms must be deduplicated beforehand; two inserts of one text in the same
+# query would conflict with each other rather than with the existing Term
+TERMS_INSERT = """
+select (
+    for term in json_array_unpack(<json>$terms) union (
         INSERT Term {
-            text := <str>$text,
-            len := <int16>$term_len,
+            text := <str>term['text'],
+            len := <int16>term['len'],
         } unless conflict on .text
         else Term
-    ),
-    attr := <Attribute>$attr,
-    community := <Community>$community,
-    day := <datetime>$day,
-    hits := <int64>$hits,
-    authors := (
-        SELECT Author FILTER .id in array_unpack(<array<uuid>>$authors)
     )
-}
+) { text }
+"""
+
+# terms are referenced by id; see MessageDB.term_ids
+FREQS_INSERT = """
+for freq in json_array_unpack(<json>$freqs) union (
+    INSERT Frequency {
+        term := <Term><uuid>freq['term'],
+        attr := <Attribute><str>freq['attr'],
+        community := <Community><uuid>freq['community'],
+        day := <datetime>freq['day'],
+        hits := <int64>freq['hits'],
+        authors := (
+            SELECT Author FILTER .id in <uuid>json_array_unpack(freq['authors'])
+        )
+    }
+)
 """
-# community := (
-#     SELECT Community FILTER
-#     .id in array_unpack(<array<uuid>>$communities)
-# ),
 
 
 FREQ_INSERT_CONFLICT = """
 unless conflict on (.term, .community, .day)
 else (update Frequency set { hits := <int64>$hits });
-"""  # TODO: optionally add to FREQ_INSERT
+"""  # TODO: optionally add to FREQS_INSERT
+
+DIRTY_MONTHS_SELECT = """
+select DirtyMonth { community := .community.id, month } order by .month
+"""
+
+DIRTY_MONTH_INSERT = """
+INSERT DirtyMonth {
+    community := <Community><uuid>$community,
+    month := <datetime>$month,
+} unless conflict on (.community, .month)
+"""
+
+DIRTY_MONTHS_DELETE = """
+delete DirtyMonth filter
+    .community.id in array_unpack(<array<uuid>>$communities)
+    and .month = <datetime>$month
+"""
+
+DIRTY_MONTHS_DELETE_ALL = """
+delete DirtyMonth
+"""
+
+# a term has at most one All frequency per community and day, but may appear
+# in several of the given communities, so the hits are summed per term first
+STALE_TERM_HITS_UPDATE = """
+for group_ in (
+    group (
+        select Frequency filter
+            .community.id in array_unpack(<array<uuid>>$communities)
+            and .day = <datetime>$day
+            and .attr = Attribute.All
+    ) by .term
+) union (
+    update group_.key.term
+    set { total_hits := .total_hits - sum(group_.elements.hits) }
+)
+"""
+
+STALE_FREQ_DELETE = """
+delete Frequency filter
+    .community.id in array_unpack(<array<uuid>>$communities)
+    and .day = <datetime>$day
+"""
 
 UPDATE_NUM_SENTS = """
 update Author
     set { num_tp_sentences := (select count(.<author[is Message].tp_sentences)) }
 """
 
+# hits are pre-summed per term, so each Term is updated once per batch
 TERM_HITS_UPDATE = """
-update Term
-filter .text = <str>$text
-set {
-    total_hits := .total_hits + <int64>$hits
-}
+for term in json_array_unpack(<json>$terms) union (
+    update Term
+    filter .id = <uuid>term['id']
+    set {
+        total_hits := .total_hits + <int64>term['hits']
+    }
+)
 """
 
 # TODO
@@ -237,11 +349,39 @@ set {
 """
 
 
+class CountedAuthors:
+    """
+    Every author with at least MIN_SENTS_NEEDED sentences, each given a dense
+    index so that sets of them can be held and compared as small ints.
+    """
+
+    index: dict[UUID, int]
+
+    def __init__(self, authors: Iterable[UUID]):
+        self.index = {author: i for i, author in enumerate(authors)}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def indices(self, authors: Iterable[UUID]) -> set[int]:
+        """Map the counted authors among `authors` to their index, dropping the rest."""
+        index = self.index
+        return {i for author in authors if (i := index.get(author)) is not None}
+
+
 class MessageDB:
     client: AsyncIOClient
+    # (community, month) buckets already marked dirty in the db this session
+    dirty_months: set[tuple[UUID, datetime]]
+    # text -> Term id; loaded on first use, then extended as terms are inserted
+    term_ids: dict[str, UUID] | None
+    counted_authors: CountedAuthors | None
 
     def __init__(self, username: str, password: str, host: str, port: int) -> None:
         self.client = create_client(username, password, host, port)
+        self.dirty_months = set()
+        self.term_ids = None
+        self.counted_authors = None
 
     @alru_cache
     async def __select_platform(self, _id: int) -> UUID | None:
@@ -430,7 +570,11 @@ class MessageDB:
     async def insert_message(self, message: Message):
         community_id = await self.insert_community(message["community"])
         author_id = await self.insert_author(message["author"])
-        message_id = await self.__insert_message(
+        if message["sentences"]:
+            # month boundaries are in UTC, same as the frequency data
+            month = adjust_month(message["postdate"].astimezone(UTC))
+            await self.mark_dirty_month(community_id, month)
+        _ = await self.__insert_message(
             _id=message["_id"],
             author=author_id,
             community=community_id,
@@ -442,13 +586,162 @@ class MessageDB:
             container=message.get("container", None),
         )
 
-    async def insert_frequency(self, freq: GelFrequency):
-        _ = await self.client.query(FREQ_INSERT, **freq)
-        if freq["attr"] == Attribute.All:
+    async def mark_dirty_month(self, community: UUID, month: datetime):
+        """Persist that a bucket will receive new sentences.
+
+        This happens before the message is inserted, so a crash can at worst
+        leave a bucket dirty that didn't need to be, never the reverse."""
+        if (community, month) in self.dirty_months:
+            return
+        _ = await self.client.query(
+            DIRTY_MONTH_INSERT, community=community, month=month
+        )
+        self.dirty_months.add((community, month))
+
+    async def select_dirty_months(self) -> dict[datetime, list[UUID]]:
+        """Fetch every dirty bucket, as a map of month to its dirty communities."""
+        results = await self.client.query(DIRTY_MONTHS_SELECT)
+        output: dict[datetime, list[UUID]] = dict()
+        for result in results:
+            if result.month not in output:
+                output[result.month] = list()
+            output[result.month].append(result.community)
+        return output
+
+    async def clear_dirty_months(
+        self,
+        communities: list[UUID] | None = None,
+        month: datetime | None = None,
+    ):
+        """Mark the given communities' month as clean, or every bucket if unspecified."""
+        if communities is None or month is None:
+            _ = await self.client.query(DIRTY_MONTHS_DELETE_ALL)
+            self.dirty_months = set()
+            return
+        self.dirty_months -= {(community, month) for community in communities}
+        _ = await self.client.query(
+            DIRTY_MONTHS_DELETE,
+            communities=communities,
+            month=month,
+        )
+
+    async def delete_freqs(self, communities: list[UUID], day: datetime):
+        """Drop the frequencies of the given communities on `day`, and un-count
+        their hits from each Term's total."""
+        async for tx in self.client.transaction():
+            async with tx:
+                _ = await tx.query(
+                    STALE_TERM_HITS_UPDATE,
+                    communities=communities,
+                    day=day,
+                )
+                _ = await tx.query(
+                    STALE_FREQ_DELETE,
+                    communities=communities,
+                    day=day,
+                )
+
+    async def load_term_ids(self):
+        """Fetch the id of every existing Term, so frequencies can refer to them directly."""
+        results = await self.client.query(TERMS_SELECT)
+        self.term_ids = {result.text: cast(UUID, result.id) for result in results}
+
+    async def insert_terms(self, terms: dict[str, int]):
+        """Create the given terms, as a map of text to length, and remember their ids."""
+        if self.term_ids is None:
+            await self.load_term_ids()
+        assert self.term_ids is not None
+
+        new_terms = [
+            {"text": text, "len": term_len}
+            for text, term_len in terms.items()
+            if text not in self.term_ids
+        ]
+        if not new_terms:
+            return
+        results = await self.client.query(
+            TERMS_INSERT,
+            terms=orjson.dumps(new_terms).decode(),
+        )
+        for result in results:
+            self.term_ids[result.text] = cast(UUID, result.id)
+
+    async def __insert_frequencies(
+        self,
+        freqs: list[GelFrequency],
+        term_hits: dict[UUID, int] | None,
+    ):
+        terms: dict[str, int] = dict()
+        for freq in freqs:
+            terms[freq["text"]] = freq["term_len"]
+        await self.insert_terms(terms)
+        assert self.term_ids is not None
+
+        packed_freqs: list[dict[str, Any]] = list()
+        batch_hits: dict[UUID, int] = defaultdict(int)
+        for freq in freqs:
+            term_id = self.term_ids[freq["text"]]
+            packed_freqs.append(
+                {
+                    "term": term_id,
+                    "attr": freq["attr"],
+                    "community": freq["community"],
+                    "day": freq["day"],
+                    "hits": freq["hits"],
+                    "authors": freq["authors"],
+                }
+            )
+            if freq["attr"] == Attribute.All:
+                batch_hits[term_id] += freq["hits"]
+
+        if term_hits is not None:
+            _ = await self.client.query(
+                FREQS_INSERT,
+                freqs=orjson.dumps(packed_freqs).decode(),
+            )
+            # only once committed, so the hits added match what was written
+            for term_id, hits in batch_hits.items():
+                term_hits[term_id] = term_hits.get(term_id, 0) + hits
+            return
+
+        packed_hits = [{"id": id, "hits": hits} for id, hits in batch_hits.items()]
+        async for tx in self.client.transaction():
+            async with tx:
+                _ = await tx.query(
+                    FREQS_INSERT,
+                    freqs=orjson.dumps(packed_freqs).decode(),
+                )
+                _ = await tx.query(
+                    TERM_HITS_UPDATE,
+                    terms=orjson.dumps(packed_hits).decode(),
+                )
+
+    async def insert_frequencies(
+        self,
+        freqs: Iterable[GelFrequency],
+        batch_size: int = FREQ_BATCH,
+        term_hits: dict[UUID, int] | None = None,
+    ):
+        """
+        Write `freqs`, adding their hits to each Term's total in the same
+        transaction. If `term_hits` is given, the hits are summed into it
+        instead, for `update_term_hits` to apply later; concurrent writers
+        would otherwise conflict on the most used terms' totals.
+        """
+        for batch in batch_iter(freqs, batch_size):
+            await self.__insert_frequencies(batch, term_hits)
+
+    async def update_term_hits(
+        self,
+        term_hits: dict[UUID, int],
+        batch_size: int = FREQ_BATCH,
+    ):
+        """Add hits summed by `insert_frequencies` to each Term's total."""
+        packed_hits = [{"id": id, "hits": hits} for id, hits in term_hits.items()]
+        for batch in batch_iter(packed_hits, batch_size):
             _ = await self.client.query(
                 TERM_HITS_UPDATE,
-                text=freq["text"],
-                hits=freq["hits"],
+                terms=orjson.dumps(batch).decode(),
             )
 
     ###########################
@@ -466,58 +759,55 @@ class MessageDB:
         maybe_id = await self.select_message(msg)
         return not not maybe_id
 
-    async def counted_sents_in_range(
+    async def communities_in_range(
         self,
         start: datetime,
         end: datetime,
         passing: bool = True,
-    ) -> list[CommSentence]:
+    ) -> list[UUID]:
+        query = FAILING_SENT_COMMUNITIES_SELECT
+        if passing:
+            query = PASSING_SENT_COMMUNITIES_SELECT
+        results = await self.client.query(query, start=start, end=end)
+        return sorted(results)
+
+    async def community_sents_in_range(
+        self,
+        start: datetime,
+        end: datetime,
+        passing: bool = True,
+        communities: list[UUID] | None = None,
+    ) -> AsyncGenerator[tuple[UUID, int, Generator[SortedSentence, None, None]], None]:
+        """
+        Page through the sentences in the given range one community at a time,
+        in community order, so only one community-month is held at once.
+        Yields the community, its number of sentences, and the sentences, which
+        are lowercased as they are consumed rather than up front.
+        """
         query = FAILING_USER_SENTS_SELECT
         if passing:
             query = PASSING_USER_SENTS_SELECT
 
-        results = await self.client.query(query, start=start, end=end)
-        output: list[CommSentence] = list()
+        if communities is None:
+            communities = await self.communities_in_range(start, end, passing)
 
-        for result in results:
-            out: CommSentence = {
-                "words": [word.lower() for word in result.words],
-                "community": result.community,
-                "author": result.author,
-            }
-            output.append(out)
-        return output
+        for community in sorted(communities):
+            results = await self.client.query(
+                query,
+                community=community,
+                start=start,
+                end=end,
+            )
+            if not results:
+                continue
+            yield community, len(results), lowered_sents(results)
 
-    @alru_cache(maxsize=None)
-    async def is_author_counted(self, author: UUID) -> bool:
-        result = await self.client.query_single(
-            AUTHOR_IS_COUNTED_SELECT,
-            author=author,
-        )
-        return not not result
-
-    async def count_nontrivial_authors(self, authors: Iterable[UUID]) -> int:
-        # NOTE: I tried asyncio.gather. it's genuinely slower, but the
-        # difference is tiny
-        counted_authors = 0
-        for author in authors:
-            counted = await self.is_author_counted(author)
-            if counted:
-                counted_authors += 1
-        return counted_authors
-
-    async def merge_frequency_data(
-        self,
-        data: Iterable[Any],
-    ) -> dict[str, Stats]:
-        output: dict[str, Stats] = dict()
-        for item in data:
-            text = item.text
-            if text not in output:
-                output[text] = {"hits": 0, "authors": set()}
-            output[text]["hits"] += item.hits
-            output[text]["authors"] |= {author.id for author in item.authors}
-        return output
+    async def load_counted_authors(self) -> CountedAuthors:
+        """Fetch every counted author at once; cached until their sentences are recounted."""
+        if self.counted_authors is None:
+            results = await self.client.query(COUNTED_AUTHORS_SELECT)
+            self.counted_authors = CountedAuthors(results)
+        return self.counted_authors
 
     async def select_freqs_in_range(
         self,
@@ -526,7 +816,6 @@ class MessageDB:
         start: datetime,
         end: datetime,
     ) -> list[SQLFrequency]:
-        """Groups on client instead of DB"""
         results = await self.client.query(
             TERM_DATA_SELECT,
             term_len=term_len,
@@ -534,22 +823,46 @@ class MessageDB:
             start=start,
             end=end,
         )
-        merged = await self.merge_frequency_data(results)
 
         output: list[SQLFrequency] = list()
-        for text, result in merged.items():
-            counted_authors = await self.count_nontrivial_authors(result["authors"])
+        for result in results:
             formatted = format_freq_sqlite(
-                text=text,
+                text=result.text,
                 term_len=term_len,
                 attr=attr,
                 day=start,
-                hits=result["hits"],
-                authors=counted_authors,
+                hits=result.hits,
+                authors=result.authors,
             )
             output.append(formatted)
         return output
 
+    async def select_freq_authors_in_range(
+        self,
+        term_len: int,
+        attr: Attribute,
+        start: datetime,
+        end: datetime,
+    ) -> dict[str, IndexedStats]:
+        """Like `select_freqs_in_range`, but keeps each term's counted authors,
+        by their index in `CountedAuthors`, so several ranges can be merged."""
+        counted_authors = await self.load_counted_authors()
+        results = await self.client.query(
+            TERM_AUTHORS_DATA_SELECT,
+            term_len=term_len,
+            attr=attr,
+            start=start,
+            end=end,
+        )
+
+        output: dict[str, IndexedStats] = dict()
+        for result in results:
+            output[result.text] = {
+                "hits": result.hits,
+                "authors": counted_authors.indices(result.authors),
+            }
+        return output
+
     async def total_hits_in_range(
         self,
         term_len: int,
@@ -576,17 +889,27 @@ class MessageDB:
         end: datetime,
         # word: str | None = None,
     ) -> int:
-        result = await self.client.query(
+        result: int = await self.client.query_required_single(
             TOTAL_AUTHORS_SELECT,
             term_len=term_len,
             attr=attr,
             start=start,
             end=end,
         )
-        return await self.count_nontrivial_authors({author.id for author in result})
+
+        return result
 
     async def update_author_tpt_sents(self) -> None:
         _ = await self.client.execute(UPDATE_NUM_SENTS)
+        self.counted_authors = None
+
+
+def lowered_sents(results: Iterable[Any]) -> Generator[SortedSentence, None, None]:
+    for result in results:
+        yield {
+            "words": [word.lower() for word in result.words],
+            "author": result.author,
+        }
 
 
 def format_freq_geldb(
@@ -621,17 +944,14 @@ def format_freq_sqlite(
     hits: int,
     authors: int,
 ) -> SQLFrequency:
-    d: SQLFrequency = {
-        "term": {
-            "text": text,
-            "len": term_len,
-        },
-        "attr": ATTRIBUTE_IDS[attr],
-        "day": int(day.timestamp()),
-        "hits": hits,
-        "authors": authors,
-    }
-    return d
+    return SQLFrequency(
+        text=text,
+        term_len=term_len,
+        attr=ATTRIBUTE_IDS[attr],
+        day=int(day.timestamp()),
+        hits=hits,
+        authors=authors,
+    )
 
 
 def load_messagedb_from_env() -> MessageDB:
@@ -1,38 +1,77 @@
 # STL
 import os
+import heapq
 import shutil
-from typing import Literal, get_args
+import asyncio
+import sqlite3
+from typing import (
+    Any,
+    Literal,
+    TypeVar,
+    Callable,
+    TypedDict,
+    get_args,
+)
 from datetime import UTC, datetime
-from contextlib import asynccontextmanager
-
-# PDM
-import aiosqlite
-from aiosqlite.core import Connection
-from aiosqlite.cursor import Cursor
+from contextlib import contextmanager
+from collections.abc import Iterable, Generator, AsyncGenerator
+from concurrent.futures import ThreadPoolExecutor
 
 # LOCAL
-from sonamute.db import MessageDB
-from sonamute.utils import now, batch_iter, epochs_in_range, months_in_range
-from sonamute.smtypes import ATTRIBUTE_IDS, SQLTerm, Attribute, SQLFrequency
+from sonamute.db import MessageDB, format_freq_sqlite
+from sonamute.utils import now, adjust_month, epochs_in_range, months_in_range
+from sonamute.series import SERIES_DECODER, build_series
+from sonamute.httpvfs import (
+    page_report,
+    chunk_database,
+    print_page_report,
+    relayout_term_ids,
+)
+from sonamute.smtypes import ATTRIBUTE_IDS, Attribute, IndexedStats, SQLFrequency
+from sonamute.constants import RANK_SIZE
+from sonamute.term_search import build_term_search
+
+T = TypeVar("T")
 
-# we insert 4 items per row; max sql variables is 999 for, reasons,
-SQLITE_BATCH = 5000
 SQLITE_POSTPROCESS = "queries/postprocess/"
+# postprocess steps numbered at least this only tidy the file, and are all
+# that is re-run after patching an already postprocessed db
+SQLITE_MAINTENANCE_STEP = 90
 
 FreqTable = Literal["monthly", "yearly"]
 FREQ_TABLES: tuple[str] = get_args(FreqTable)
 TotalTable = Literal["total_monthly", "total_yearly"]
 TOTAL_TABLES: tuple[str] = get_args(TotalTable)
-
-
-async def configure_sqlite(conn: aiosqlite.Connection):
-    _ = await conn.execute("PRAGMA foreign_keys = ON;")
-    _ = await conn.execute("PRAGMA synchronous = OFF;")
-    _ = await conn.execute("PRAGMA journal_mode = MEMORY;")
-    _ = await conn.execute("PRAGMA cache_size = 20000;")
-    _ = await conn.execute("PRAGMA page_size = 65536;")
-
-    _ = await conn.execute(
+RankTable = Literal["monthly_rank", "yearly_rank"]
+RANK_TABLES: tuple[str] = get_args(RankTable)
+
+# columns of every table holding periods, in the order they are copied
+TABLE_COLUMNS = {
+    "monthly": "term_id, attr, day, hits, authors",
+    "yearly": "term_id, attr, day, hits, authors",
+    "monthly_rank": "term_len, attr, day, rank, term_id, hits, authors",
+    "yearly_rank": "term_len, attr, day, rank, term_id, hits, authors",
+    "total_monthly": "day, term_len, attr, hits, authors",
+    "total_yearly": "day, term_len, attr, hits, authors",
+}
+
+# day, term_len, attr, hits, authors
+SQLTotal = tuple[int, int, int, int, int]
+# table, term_len, attr, day; identifies one written slice
+SliceKey = tuple[str, int, int, int]
+
+
+def configure_sqlite(conn: sqlite3.Connection):
+    _ = conn.execute("PRAGMA foreign_keys = ON;")
+    # before WAL, which fixes the page size of a new db
+    _ = conn.execute("PRAGMA page_size = 65536;")
+    # each committed slice survives the export being killed, and an interrupted
+    # one leaves nothing behind, so export_progress can be trusted on resume
+    _ = conn.execute("PRAGMA journal_mode = WAL;")
+    _ = conn.execute("PRAGMA synchronous = NORMAL;")
+    _ = conn.execute("PRAGMA cache_size = 20000;")
+
+    _ = conn.execute(
         """
     CREATE TABLE IF NOT EXISTS term (
         id INTEGER NOT NULL,
@@ -45,7 +84,7 @@ async def configure_sqlite(conn: aiosqlite.Connection):
     )
 
     for table in FREQ_TABLES:
-        _ = await conn.execute(
+        _ = conn.execute(
             f"""
         CREATE TABLE IF NOT EXISTS {table} (
             term_id INTEGER NOT NULL,
@@ -60,7 +99,7 @@ async def configure_sqlite(conn: aiosqlite.Connection):
         )
 
     for table in TOTAL_TABLES:
-        _ = await conn.execute(
+        _ = conn.execute(
             f"""
         CREATE TABLE IF NOT EXISTS {table} (
             day INTEGER NOT NULL,
@@ -73,260 +112,889 @@ async def configure_sqlite(conn: aiosqlite.Connection):
         """
         )
 
-    await conn.commit()
+    for table in RANK_TABLES:
+        _ = conn.execute(
+            f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            term_len INTEGER NOT NULL,
+            attr INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            term_id INTEGER NOT NULL,
+            hits INTEGER NOT NULL,
+            authors INTEGER NOT NULL,
+            PRIMARY KEY (term_len, attr, day, rank),
+            FOREIGN KEY (term_id) REFERENCES term(id)
+        ) WITHOUT ROWID;
+        """
+        )
+
+    # bookkeeping for resuming an export; dropped from the trimmed db
+    _ = conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS export_params (
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (key)
+    );
+    """
+    )
+    _ = conn.execute(
+        """
+    CREATE TABLE IF NOT EXISTS export_progress (
+        tbl TEXT NOT NULL,
+        term_len INTEGER NOT NULL,
+        attr INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        PRIMARY KEY (tbl, term_len, attr, day)
+    ) WITHOUT ROWID;
+    """
+    )
+
+
+def has_table(conn: sqlite3.Connection, name: str) -> bool:
+    query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return conn.execute(query, (name,)).fetchone() is not None
 
 
 class FreqDB:
-    def __init__(self, database_file: str):
+    """
+    Bulk writer for the exported SQLite file.
+
+    All work happens on one dedicated thread with stdlib sqlite3, in explicit
+    transactions, binding plain tuples. sqlite3 keeps each statement prepared
+    between calls, so repeated inserts don't re-parse their SQL.
+    """
+
+    def __init__(
+        self,
+        database_file: str,
+        staged: bool = False,
+        rank_size: int = RANK_SIZE,
+    ):
         self.db_file: str = database_file
-        self.conn: Connection | None = None
+        # if staged, frequencies are appended to unkeyed tables, then
+        # copied into their WITHOUT ROWID tables in primary key order by
+        # `finalize`, so each B-tree is built by appending instead of splitting
+        self.staged: bool = staged
+        self.rank_size: int = rank_size
+        self.conn: sqlite3.Connection | None = None
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="freqdb",
+        )
+        # text -> term.id; this is the only writer, so ids are assigned here
+        self.term_ids: dict[str, int] | None = None
+        self.next_term_id: int = 1
 
     async def __ainit__(self):
-        async with self.session() as s:
-            await configure_sqlite(s)
+        await self.run(self.__configure)
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Run `func` on the writer's thread, the only one to touch the connection."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
 
     async def close(self):
         if self.conn:
-            await self.conn.close()
+            await self.run(self.conn.close)
+            self.conn = None
+        self.executor.shutdown()
 
-    @asynccontextmanager
-    async def session(self):
+    def session(self) -> sqlite3.Connection:
         if not self.conn:
-            self.conn = await aiosqlite.connect(self.db_file)
-        yield self.conn
-
-    async def execute(self, query: str) -> Cursor:
-        async with self.session() as s:
-            result = await s.execute(query)
-            await s.commit()
-        return result
-
-    async def upsert_term(self, data: list[SQLTerm]):
-        result: list[tuple[str, int]] = []
-        async with self.session() as s:
-            stmt = """
-            INSERT INTO term (len, text) VALUES (:len, :text)
-            ON CONFLICT (text) DO UPDATE SET len = len
-            RETURNING text, id
-            """
-            # cursor = await s.executemany(stmt, data)
-            # while row := await cursor.fetchone():
-            #     rows.append(row)
-
-            # result = await cursor.fetchone()
-            # rows.append(result)
-            # executemany doesn't support returning..
-            for d in data:
-                cursor = await s.execute(stmt, d)
-                returned = await cursor.fetchone()
-                result.append(returned)
-            await s.commit()
-
-        term_id_map: dict[str, int] = dict()
-        for term, id in result:
-            term_id_map[term] = id
-        return term_id_map
-
-    async def insert_freq(self, data: list[SQLFrequency], table: FreqTable):
-        terms = [d["term"] for d in data]
-        term_id_map = await self.upsert_term(terms)
-        for d in data:
-            d["term_id"] = term_id_map[d["term"]["text"]]
-            d.pop("term")
-
-        async with self.session() as s:
-            stmt = f"""
-            INSERT INTO {table} (term_id, attr, day, hits, authors)
-            VALUES (:term_id, :attr, :day, :hits, :authors)
-            """
-            _ = await s.executemany(stmt, parameters=data)
-            await s.commit()
+            # autocommit; every write below opens its own transaction
+            self.conn = sqlite3.connect(self.db_file, isolation_level=None)
+        return self.conn
+
+    @contextmanager
+    def transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        conn = self.session()
+        _ = conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            _ = conn.execute("ROLLBACK")
+            raise
+        _ = conn.execute("COMMIT")
+
+    def __configure(self):
+        conn = self.session()
+        configure_sqlite(conn)
+        if self.staged:
+            for table in FREQ_TABLES:
+                _ = conn.execute(
+                    f"""
+                CREATE TABLE IF NOT EXISTS {table}_staged (
+                    term_id INTEGER NOT NULL,
+                    attr INTEGER NOT NULL,
+                    day INTEGER NOT NULL,
+                    hits INTEGER NOT NULL,
+                    authors INTEGER NOT NULL
+                );
+                """
+                )
+
+    def __execute(self, query: str):
+        _ = self.session().execute(query)
+
+    async def execute(self, query: str):
+        await self.run(self.__execute, query)
+
+    def __load_term_ids(self):
+        rows = self.session().execute("SELECT text, id FROM term").fetchall()
+        self.term_ids = {text: id for text, id in rows}
+        self.next_term_id = max(self.term_ids.values(), default=0) + 1
+
+    def __upsert_terms(
+        self,
+        conn: sqlite3.Connection,
+        data: list[SQLFrequency],
+    ) -> dict[str, int]:
+        if self.term_ids is None:
+            self.__load_term_ids()
+        assert self.term_ids is not None
+
+        new_terms: list[tuple[int, int, str]] = list()
+        for freq in data:
+            if freq.text in self.term_ids:
+                continue
+            self.term_ids[freq.text] = self.next_term_id
+            new_terms.append((self.next_term_id, freq.term_len, freq.text))
+            self.next_term_id += 1
+
+        if new_terms:
+            stmt = "INSERT INTO term (id, len, text) VALUES (?, ?, ?)"
+            _ = conn.executemany(stmt, new_terms)
+        return self.term_ids
+
+    def __insert_freqs(
+        self,
+        conn: sqlite3.Connection,
+        data: list[SQLFrequency],
+        table: FreqTable,
+    ):
+        term_ids = self.__upsert_terms(conn, data)
+        if self.staged:
+            table = f"{table}_staged"
+        stmt = f"""
+        INSERT INTO {table} (term_id, attr, day, hits, authors)
+        VALUES (?, ?, ?, ?, ?)
+        """
+        rows = ((term_ids[d.text], d.attr, d.day, d.hits, d.authors) for d in data)
+        _ = conn.executemany(stmt, rows)
 
-    async def insert_total(
+    def __insert_ranks(
         self,
-        term_len: int,
-        attr: int,
-        day: int,
-        hits: int,
-        authors: int,
+        conn: sqlite3.Connection,
+        data: list[SQLFrequency],
+        table: FreqTable,
+        total: SQLTotal,
+    ):
+        day, term_len, attr, _, _ = total
+        term_ids = self.term_ids
+        assert term_ids is not None
+
+        top = heapq.nsmallest(
+            self.rank_size,
+            data,
+            key=lambda d: (-d.hits, -d.authors, d.text),
+        )
+        stmt = f"""
+        INSERT INTO {table}_rank (term_len, attr, day, rank, term_id, hits, authors)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        rows = (
+            (term_len, attr, day, rank, term_ids[d.text], d.hits, d.authors)
+            for rank, d in enumerate(top, start=1)
+        )
+        _ = conn.executemany(stmt, rows)
+
+    def __insert_total(
+        self,
+        conn: sqlite3.Connection,
+        total: SQLTotal,
         table: TotalTable,
-        # TODO: should there be an object here
     ):
-        async with self.session() as s:
-            stmt = f"""
-            INSERT INTO {table} (day, term_len, attr, hits, authors)
-            VALUES (:day, :term_len, :attr, :hits, :authors)
+        stmt = f"""
+        INSERT INTO {table} (day, term_len, attr, hits, authors)
+        VALUES (?, ?, ?, ?, ?)
+        """
+        _ = conn.execute(stmt, total)
+
+    def __insert_slice(
+        self,
+        data: list[SQLFrequency],
+        table: FreqTable,
+        total: SQLTotal,
+        total_table: TotalTable,
+    ):
+        day, term_len, attr, _, _ = total
+        with self.transaction() as conn:
+            self.__insert_freqs(conn, data, table)
+            self.__insert_ranks(conn, data, table, total)
+            self.__insert_total(conn, total, total_table)
+            stmt = """
+            INSERT INTO export_progress (tbl, term_len, attr, day)
+            VALUES (?, ?, ?, ?)
             """
-            _ = await s.execute(
-                stmt,
-                {
-                    "day": day,
-                    "term_len": term_len,
-                    "attr": attr,
-                    "hits": hits,
-                    "authors": authors,
-                },
+            _ = conn.execute(stmt, (table, term_len, attr, day))
+
+    async def insert_slice(
+        self,
+        data: list[SQLFrequency],
+        table: FreqTable,
+        total: SQLTotal,
+        total_table: TotalTable,
+    ):
+        """Write one period's frequencies, its top terms, its totals, and a record
+        that it is done in a single transaction, so a slice is either entirely written or not
+        at all."""
+        await self.run(self.__insert_slice, data, table, total, total_table)
+
+    def __check_params(self, params: dict[str, str]):
+        with self.transaction() as conn:
+            rows = conn.execute("SELECT key, value FROM export_params").fetchall()
+            existing = {key: value for key, value in rows}
+            if existing and existing != params:
+                raise ValueError(
+                    f"{self.db_file} is a partial export with different parameters "
+                    f"({existing}); remove it to export with {params}"
+                )
+            if not existing:
+                stmt = "INSERT INTO export_params (key, value) VALUES (?, ?)"
+                _ = conn.executemany(stmt, params.items())
+
+    def __load_params(self) -> dict[str, str]:
+        rows = self.session().execute("SELECT key, value FROM export_params")
+        return {key: value for key, value in rows.fetchall()}
+
+    async def load_params(self) -> dict[str, str]:
+        return await self.run(self.__load_params)
+
+    def __replace_params(self, params: dict[str, str]):
+        with self.transaction() as conn:
+            _ = conn.execute("DELETE FROM export_params")
+            stmt = "INSERT INTO export_params (key, value) VALUES (?, ?)"
+            _ = conn.executemany(stmt, params.items())
+
+    async def replace_params(self, params: dict[str, str]):
+        await self.run(self.__replace_params, params)
+
+    async def check_params(self, params: dict[str, str]):
+        """Record `params` for a new export, or make sure a partial export
+        being resumed was started with the same ones."""
+        await self.run(self.__check_params, params)
+
+    def __load_progress(self) -> set[SliceKey]:
+        query = "SELECT tbl, term_len, attr, day FROM export_progress"
+        return set(self.session().execute(query).fetchall())
+
+    async def load_progress(self) -> set[SliceKey]:
+        """Every slice already written by an earlier run of this export."""
+        return await self.run(self.__load_progress)
+
+    def __period_filters(
+        self,
+        monthly_since: int,
+        yearly_days: list[int],
+    ) -> dict[str, tuple[str, list[int]]]:
+        """WHERE clause and its params selecting the given periods, by table."""
+        days = ", ".join("?" * len(yearly_days))
+        monthly = ("day >= ?", [monthly_since])
+        yearly = (f"day IN ({days})", yearly_days)
+        return {
+            "monthly": monthly,
+            "monthly_rank": monthly,
+            "total_monthly": monthly,
+            "yearly": yearly,
+            "yearly_rank": yearly,
+            "total_yearly": yearly,
+        }
+
+    def __clear_periods(
+        self,
+        conn: sqlite3.Connection,
+        monthly_since: int,
+        yearly_days: list[int],
+    ):
+        filters = self.__period_filters(monthly_since, yearly_days)
+        if self.staged:
+            filters["monthly_staged"] = filters["monthly"]
+            filters["yearly_staged"] = filters["yearly"]
+        for table, (where, params) in filters.items():
+            _ = conn.execute(f"DELETE FROM {table} WHERE {where}", params)
+
+    def __clear_export_periods(self, monthly_since: int, yearly_days: list[int]):
+        days = ", ".join("?" * len(yearly_days))
+        with self.transaction() as conn:
+            self.__clear_periods(conn, monthly_since, yearly_days)
+            _ = conn.execute(
+                f"""
+            DELETE FROM export_progress
+            WHERE (tbl = 'monthly' AND day >= ?)
+            OR (tbl = 'yearly' AND day IN ({days}))
+            """,
+                [monthly_since, *yearly_days],
             )
-            await s.commit()
 
+    async def clear_export_periods(self, monthly_since: int, yearly_days: list[int]):
+        """Delete every monthly period from `monthly_since` on and the given yearly
+        periods, along with their totals and progress, so they are exported again."""
+        await self.run(self.__clear_export_periods, monthly_since, yearly_days)
+
+    def __patch_periods(
+        self,
+        source_file: str,
+        monthly_since: int,
+        yearly_days: list[int],
+    ):
+        conn = self.session()
+        _ = conn.execute("ATTACH DATABASE ? AS source", (source_file,))
+        try:
+            with self.transaction() as conn:
+                self.__clear_periods(conn, monthly_since, yearly_days)
+                # this db's term ids may have been laid out anew, so terms are
+                # matched by text, and new ones are numbered after the rest
+                _ = conn.execute(
+                    """
+                INSERT INTO term (id, len, text)
+                SELECT
+                    (SELECT coalesce(max(id), 0) FROM main.term)
+                    + row_number() OVER (ORDER BY id),
+                    len,
+                    text
+                FROM source.term
+                WHERE text NOT IN (SELECT text FROM main.term)
+                """
+                )
+                if has_table(conn, "term_search"):
+                    build_term_search(conn)
+                filters = self.__period_filters(monthly_since, yearly_days)
+                for table, (where, params) in filters.items():
+                    columns = TABLE_COLUMNS[table]
+                    if table in TOTAL_TABLES:
+                        select = f"SELECT {columns} FROM source.{table} WHERE {where}"
+                    else:
+                        selected = ", ".join(
+                            "main.term.id" if c == "term_id" else f"f.{c}"
+                            for c in columns.split(", ")
+                        )
+                        select = f"""
+                        SELECT {selected}
+                        FROM (SELECT * FROM source.{table} WHERE {where}) AS f
+                        JOIN source.term ON source.term.id = f.term_id
+                        JOIN main.term ON main.term.text = source.term.text
+                        """
+                    _ = conn.execute(
+                        f"INSERT INTO {table} ({columns}) {select}",
+                        params,
+                    )
+                if has_table(conn, "monthly_series"):
+                    build_series(conn)
+        finally:
+            _ = conn.execute("DETACH DATABASE source")
+
+    async def patch_periods(
+        self,
+        source_file: str,
+        monthly_since: int,
+        yearly_days: list[int],
+    ):
+        """Replace the given periods with those of `source_file`, an export this
+        db was copied from."""
+        await self.run(self.__patch_periods, source_file, monthly_since, yearly_days)
+
+    def __relayout_term_ids(self):
+        relayout_term_ids(self.session())
+
+    async def relayout_term_ids(self):
+        await self.run(self.__relayout_term_ids)
+
+    def __build_term_search(self):
+        with self.transaction() as conn:
+            build_term_search(conn)
+
+    async def build_term_search(self):
+        await self.run(self.__build_term_search)
+
+    def __build_series(self):
+        with self.transaction() as conn:
+            build_series(conn)
+
+    async def build_series(self):
+        await self.run(self.__build_series)
+
+    def __finalize(self):
+        if not self.staged:
+            return
+        with self.transaction() as conn:
+            for table in FREQ_TABLES:
+                _ = conn.execute(
+                    f"""
+                INSERT INTO {table} (term_id, attr, day, hits, authors)
+                SELECT term_id, attr, day, hits, authors FROM {table}_staged
+                ORDER BY term_id, attr, day
+                """
+                )
+                _ = conn.execute(f"DROP TABLE {table}_staged")
+
+    async def finalize(self):
+        """Move staged frequencies into their tables in primary key order."""
+        await self.run(self.__finalize)
 
-async def freqdb_factory(database_file: str) -> FreqDB:
-    t = FreqDB(database_file=database_file)
+
+async def freqdb_factory(
+    database_file: str,
+    staged: bool = False,
+    rank_size: int = RANK_SIZE,
+) -> FreqDB:
+    t = FreqDB(database_file=database_file, staged=staged, rank_size=rank_size)
     await t.__ainit__()
     return t
 
 
-async def copy_freqs(
+class SliceData(TypedDict):
+    # one period of one table, along with its totals
+    term_len: int
+    attr: Attribute
+    start: datetime
+    table: FreqTable
+    total_table: TotalTable
+    freqs: list[SQLFrequency]
+    total_hits: int
+    total_authors: int
+
+
+async def read_slice(
     edb: MessageDB,
-    sdb: FreqDB,
     term_len: int,
     attr: Attribute,
     start: datetime,
     end: datetime,
     table: FreqTable,
-):
-    # all-time ranking data
-    results = await edb.select_freqs_in_range(
-        term_len,
-        attr,
-        start,
-        end,
-        # limit=500,
+    total_table: TotalTable,
+) -> AsyncGenerator[SliceData, None]:
+    if start.timestamp() == 0:
+        print(f"all time (term len {term_len}, attr {attr}) @ {now()}")
+    else:
+        print(f"{table} {start.date()} (term len {term_len}, attr {attr}) @ {now()}")
+    freqs = await edb.select_freqs_in_range(term_len, attr, start, end)
+    total_hits = await edb.total_hits_in_range(term_len, attr, start, end)
+    total_authors = await edb.total_authors_in_range(term_len, attr, start, end)
+    yield {
+        "term_len": term_len,
+        "attr": attr,
+        "start": start,
+        "table": table,
+        "total_table": total_table,
+        "freqs": freqs,
+        "total_hits": total_hits,
+        "total_authors": total_authors,
+    }
+
+
+def slice_key(data: SliceData) -> SliceKey:
+    return (
+        data["table"],
+        data["term_len"],
+        ATTRIBUTE_IDS[data["attr"]],
+        int(data["start"].timestamp()),
     )
-    # TODO: db interface can do its own batching, because values can
-    # be added on later
-    for batch in batch_iter(results, SQLITE_BATCH):
-        await sdb.insert_freq(batch, table)
 
 
-async def copy_totals(
-    edb: MessageDB,
-    sdb: FreqDB,
+async def write_slice(sdb: FreqDB, data: SliceData):
+    total: SQLTotal = (
+        int(data["start"].timestamp()),
+        data["term_len"],
+        ATTRIBUTE_IDS[data["attr"]],
+        data["total_hits"],
+        data["total_authors"],
+    )
+    await sdb.insert_slice(data["freqs"], data["table"], total, data["total_table"])
+
+
+def merge_indexed_stats(
+    into: dict[str, IndexedStats],
+    other: dict[str, IndexedStats],
+):
+    """Add `other`'s hits and authors into `into`, term by term."""
+    for text, stats in other.items():
+        if text not in into:
+            # copied so later merges can't alias another period's authors
+            into[text] = {"hits": stats["hits"], "authors": set(stats["authors"])}
+            continue
+        merged = into[text]
+        merged["hits"] += stats["hits"]
+        merged["authors"] |= stats["authors"]
+
+
+def total_indexed_stats(stats: dict[str, IndexedStats]) -> tuple[int, int]:
+    """Total hits and distinct authors across every term."""
+    hits = 0
+    authors: set[int] = set()
+    for term_stats in stats.values():
+        hits += term_stats["hits"]
+        authors |= term_stats["authors"]
+    return hits, len(authors)
+
+
+def indexed_stats_slice(
+    stats: dict[str, IndexedStats],
     term_len: int,
     attr: Attribute,
     start: datetime,
-    end: datetime,
-    table: TotalTable,
-):
-    total_hits = await edb.total_hits_in_range(
-        term_len,
-        attr,
-        start,
-        end,
-    )
-    total_authors = await edb.total_authors_in_range(
-        term_len,
-        attr,
-        start,
-        end,
-    )
-    await sdb.insert_total(
-        term_len=term_len,
-        attr=ATTRIBUTE_IDS[attr],
-        day=int(start.timestamp()),
-        hits=total_hits,
-        authors=total_authors,
-        table=table,
+    table: FreqTable,
+    total_table: TotalTable,
+) -> SliceData:
+    freqs = [
+        format_freq_sqlite(
+            text=text,
+            term_len=term_len,
+            attr=attr,
+            day=start,
+            hits=term_stats["hits"],
+            authors=len(term_stats["authors"]),
+        )
+        for text, term_stats in stats.items()
+    ]
+    total_hits, total_authors = total_indexed_stats(stats)
+    return {
+        "term_len": term_len,
+        "attr": attr,
+        "start": start,
+        "table": table,
+        "total_table": total_table,
+        "freqs": freqs,
+        "total_hits": total_hits,
+        "total_authors": total_authors,
+    }
+
+
+async def rollup_slices(
+    edb: MessageDB,
+    term_len: int,
+    attr: Attribute,
+    first_msg_dt: datetime,
+    last_msg_dt: datetime,
+) -> AsyncGenerator[SliceData, None]:
+    """
+    Fetch every month's data once, then derive each epoch and all time by merging
+    the months locally, instead of asking the db for every period separately.
+
+    Periods are made of whole months, so the all time data ends at the end of the
+    month containing `last_msg_dt` rather than exactly at it.
+    """
+    db_first_dt, db_last_dt = await edb.get_msg_date_range()
+    monthly = {start for start, _ in months_in_range(first_msg_dt, last_msg_dt)}
+    epochs = list(epochs_in_range(first_msg_dt, last_msg_dt))
+
+    all_time: dict[str, IndexedStats] = dict()
+    epoch: dict[str, IndexedStats] = dict()
+    epoch_i = 0
+
+    # every month is fetched, since epochs and all time may extend past the
+    # requested range
+    for start, end in months_in_range(db_first_dt, db_last_dt):
+        while epoch_i < len(epochs) and start >= epochs[epoch_i][1]:
+            epoch_start = epochs[epoch_i][0]
+            yield indexed_stats_slice(
+                epoch, term_len, attr, epoch_start, "yearly", "total_yearly"
+            )
+            epoch = dict()
+            epoch_i += 1
+
+        print(f"rollup {start.date()} (term len {term_len}, attr {attr}) @ {now()}")
+        month = await edb.select_freq_authors_in_range(term_len, attr, start, end)
+        if start in monthly:
+            yield indexed_stats_slice(
+                month, term_len, attr, start, "monthly", "total_monthly"
+            )
+        if epoch_i < len(epochs) and start >= epochs[epoch_i][0]:
+            merge_indexed_stats(epoch, month)
+        if start < last_msg_dt:
+            merge_indexed_stats(all_time, month)
+
+    for epoch_start, _ in epochs[epoch_i:]:
+        yield indexed_stats_slice(
+            epoch, term_len, attr, epoch_start, "yearly", "total_yearly"
+        )
+        epoch = dict()
+
+    zero_dt = datetime.fromtimestamp(0, tz=UTC)
+    yield indexed_stats_slice(
+        all_time, term_len, attr, zero_dt, "yearly", "total_yearly"
     )
 
 
-async def generate_sqlite(
+def export_jobs(
     edb: MessageDB,
-    filename: str,
-    trimmed_filename: str,
-    min_date: datetime,
-    max_date: datetime,
+    first_msg_dt: datetime,
+    last_msg_dt: datetime,
     max_term_len: int,
-):
-    sdb = await freqdb_factory(filename)
-    first_msg_dt, last_msg_dt = await edb.get_msg_date_range()
-    if first_msg_dt < min_date:
-        first_msg_dt = min_date
-    if last_msg_dt > max_date:
-        last_msg_dt = max_date
+    rollup: bool,
+    done: set[SliceKey],
+) -> Generator[AsyncGenerator[SliceData, None], None, None]:
+    """
+    Every unit of reading work for the export, in the order they should start.
 
-    print(f"Dumping frequency data to SQLite @ {now()}")
+    Jobs whose slices are all in `done` are skipped.
+    """
+    zero_dt = datetime.fromtimestamp(0, tz=UTC)
     for term_len in range(1, max_term_len + 1):
         for attr in Attribute:
-            print(f"all time (term len {term_len}, attr {attr}) @ {now()}")
-            zero_dt = datetime.fromtimestamp(0, tz=UTC)
-            await copy_freqs(
-                edb,
-                sdb,
-                term_len,
-                attr,
-                zero_dt,
-                last_msg_dt,
-                "yearly",
-            )
-            await copy_totals(
-                edb,
-                sdb,
-                term_len,
-                attr,
-                zero_dt,
-                last_msg_dt,
-                "total_yearly",
-            )
+            attr_id = ATTRIBUTE_IDS[attr]
+            if rollup:
+                # all time is the last slice a rollup writes
+                if ("yearly", term_len, attr_id, 0) not in done:
+                    yield rollup_slices(edb, term_len, attr, first_msg_dt, last_msg_dt)
+                continue
+
+            # all-time ranking data
+            if ("yearly", term_len, attr_id, 0) not in done:
+                yield read_slice(
+                    edb,
+                    term_len,
+                    attr,
+                    zero_dt,
+                    last_msg_dt,
+                    "yearly",
+                    "total_yearly",
+                )
 
             # per-epoch (aug 1-aug 1) ranking data
             # TODO: what if the period is smaller than or significantly offset
             # from the epochs
             for start, end in epochs_in_range(first_msg_dt, last_msg_dt):
-                print(
-                    f"yearly {start.date()} (term len {term_len}, attr {attr}) @ {now()}"
-                )
-                await copy_freqs(
+                if ("yearly", term_len, attr_id, int(start.timestamp())) in done:
+                    continue
+                yield read_slice(
                     edb,
-                    sdb,
                     term_len,
                     attr,
                     start,
                     end,
                     "yearly",
-                )
-                await copy_totals(
-                    edb,
-                    sdb,
-                    term_len,
-                    attr,
-                    start,
-                    end,
                     "total_yearly",
                 )
 
             # periodic frequency data
             for start, end in months_in_range(first_msg_dt, last_msg_dt):
-                print(f"monthly {start.date()} (pl {term_len}, attr {attr}) @ {now()}")
-                await copy_freqs(
+                if ("monthly", term_len, attr_id, int(start.timestamp())) in done:
+                    continue
+                yield read_slice(
                     edb,
-                    sdb,
                     term_len,
                     attr,
                     start,
                     end,
                     "monthly",
-                )
-                await copy_totals(
-                    edb,
-                    sdb,
-                    term_len,
-                    attr,
-                    start,
-                    end,
                     "total_monthly",
                 )
 
-    await sdb.close()
-    print("Copying database")
-    shutil.copy(filename, trimmed_filename)
-    sdb = await freqdb_factory(trimmed_filename)
 
+async def export_slices(
+    sdb: FreqDB,
+    jobs: Iterable[AsyncGenerator[SliceData, None]],
+    workers: int,
+    done: set[SliceKey],
+):
+    """
+    Run up to `workers` jobs against Gel at once, funneling every slice they
+    produce through a bounded queue to a single SQLite writer.
+
+    Slices in `done` were written by an earlier run, and are dropped.
+    """
+    job_iter = iter(jobs)
+    # shared by every reader; each takes the next job when it finishes one
+    results: asyncio.Queue[SliceData | None] = asyncio.Queue(workers)
+
+    async def read():
+        for job in job_iter:
+            async for data in job:
+                await results.put(data)
+
+    async def read_all():
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(workers):
+                _ = tg.create_task(read())
+        await results.put(None)
+
+    async def write():
+        while data := await results.get():
+            if slice_key(data) in done:
+                continue
+            await write_slice(sdb, data)
+
+    async with asyncio.TaskGroup() as tg:
+        _ = tg.create_task(read_all())
+        _ = tg.create_task(write())
+
+
+def changed_periods(
+    first_msg_dt: datetime,
+    last_msg_dt: datetime,
+    since: datetime,
+) -> tuple[int, list[int]]:
+    """
+    Periods an export must redo to take in data from `since` on: every month
+    from the one containing `since`, as a start day, and the start day of every
+    epoch overlapping them, along with all time.
+    """
+    since = adjust_month(since)
+    yearly_days = [
+        int(start.timestamp())
+        for start, end in epochs_in_range(first_msg_dt, last_msg_dt)
+        if end > since
+    ]
+    yearly_days.append(0)
+    return int(since.timestamp()), yearly_days
+
+
+async def postprocess_sqlite(sdb: FreqDB, first_step: int = 0):
     for root, _, files in os.walk(SQLITE_POSTPROCESS):
         for file in sorted(files):
+            step = int(file.split("-", 1)[0])
+            if step < first_step:
+                continue
             file = os.path.join(root, file)
             print(f"Executing {file}")
             with open(file, "r") as f:
                 query = f.read()
             _ = await sdb.execute(query)
+
+
+async def generate_sqlite(
+    edb: MessageDB,
+    filename: str,
+    trimmed_filename: str,
+    min_date: datetime,
+    max_date: datetime,
+    max_term_len: int,
+    rollup: bool = False,
+    workers: int = 1,
+    sorted_load: bool = False,
+    since: datetime | None = None,
+    httpvfs_dir: str | None = None,
+    rank_size: int = RANK_SIZE,
+    term_search: bool = False,
+    series: bool = False,
+    parquet_dir: str | None = None,
+):
+    """
+    Export frequency data to `filename`, then copy it to `trimmed_filename` and
+    postprocess the copy.
+
+    If `since` is given, `filename` must be an earlier export with the same
+    parameters other than its end; only periods with data from `since` on are
+    exported again, and an existing `trimmed_filename` is patched in place. This
+    can't be combined with `rollup`: an export holds each period's author count,
+    not its authors, so its yearly and all time periods can't be merged anew from
+    its months, and would have to be read from every month in Gel again.
+
+    If `httpvfs_dir` is given, the trimmed db's terms are laid out for
+    sql.js-httpvfs, then it is chunked into that directory.
+
+    If `term_search` is set, the trimmed db gets a trigram index of terms for
+    wildcard searches; see `sonamute.term_search`. If `series` is set, it also
+    gets every monthly series packed into one row; see `sonamute.series`. `monthly`
+    is kept as well, since unranked top terms and patching read it, so this makes
+    the trimmed db larger. A packed series reads about half the pages of the same
+    series from `monthly`, but in as many range requests, since both are bound by
+    the depth of their B-trees; compare them with `page_report`. With
+    `httpvfs_dir`, the series decoder is copied next to the chunks.
+
+    If `parquet_dir` is given, the finished export is also copied there as
+    parquet; see `sonamute.parquet`.
+    """
+    if since and rollup:
+        raise ValueError("A rollup export can't be updated with `since`")
+
+    sdb = await freqdb_factory(filename, staged=sorted_load, rank_size=rank_size)
+    first_msg_dt, last_msg_dt = await edb.get_msg_date_range()
+    if first_msg_dt < min_date:
+        first_msg_dt = min_date
+    if last_msg_dt > max_date:
+        last_msg_dt = max_date
+
+    params = {
+        "first_msg_dt": first_msg_dt.isoformat(),
+        "last_msg_dt": last_msg_dt.isoformat(),
+        "max_term_len": str(max_term_len),
+        "rollup": str(rollup),
+        "sorted_load": str(sorted_load),
+        "rank_size": str(rank_size),
+    }
+    changed: tuple[int, list[int]] | None = None
+    if since:
+        existing = await sdb.load_params()
+        _ = existing.pop("last_msg_dt", None)
+        if existing != {k: v for k, v in params.items() if k != "last_msg_dt"}:
+            raise ValueError(
+                f"{filename} is not an export with the same parameters "
+                f"({existing}); it can't be updated with {params}"
+            )
+        changed = changed_periods(first_msg_dt, last_msg_dt, since)
+        print(f"Clearing periods from {since.date()} on @ {now()}")
+        await sdb.clear_export_periods(*changed)
+        await sdb.replace_params(params)
+    else:
+        await sdb.check_params(params)
+    done = await sdb.load_progress()
+    if done:
+        print(f"Resuming export; {len(done)} slices already written")
+
+    if rollup:
+        # only merging periods locally needs authors by index
+        counted_authors = await edb.load_counted_authors()
+        print(f"Loaded {len(counted_authors)} counted authors @ {now()}")
+
+    print(f"Dumping frequency data to SQLite @ {now()}")
+    jobs = export_jobs(edb, first_msg_dt, last_msg_dt, max_term_len, rollup, done)
+    await export_slices(sdb, jobs, workers, done)
+    if sorted_load:
+        print(f"Loading staged frequency data in key order @ {now()}")
+        await sdb.finalize()
     await sdb.close()
+
+    if parquet_dir:
+        # LOCAL
+        from sonamute.parquet import export_parquet
+
+        print(f"Copying {filename} to parquet in {parquet_dir} @ {now()}")
+        await asyncio.to_thread(export_parquet, filename, parquet_dir)
+
+    if changed and os.path.exists(trimmed_filename):
+        print("Patching trimmed database")
+        # not configured; the trimmed db is already postprocessed
+        sdb = FreqDB(trimmed_filename)
+        await sdb.patch_periods(filename, *changed)
+        await postprocess_sqlite(sdb, SQLITE_MAINTENANCE_STEP)
+        await sdb.close()
+    else:
+        print("Copying database")
+        shutil.copy(filename, trimmed_filename)
+        sdb = await freqdb_factory(trimmed_filename)
+        if httpvfs_dir:
+            print(f"Laying out terms for httpvfs @ {now()}")
+            await sdb.relayout_term_ids()
+        if term_search:
+            print(f"Indexing terms for wildcard search @ {now()}")
+            await sdb.build_term_search()
+        if series:
+            print(f"Packing monthly series @ {now()}")
+            await sdb.build_series()
+        await postprocess_sqlite(sdb)
+        await sdb.close()
+
+    if httpvfs_dir:
+        print(f"Chunking {trimmed_filename} into {httpvfs_dir}")
+        _ = chunk_database(trimmed_filename, httpvfs_dir)
+        conn = sqlite3.connect(trimmed_filename)
+        if has_table(conn, "monthly_series"):
+            _ = shutil.copy(SERIES_DECODER, httpvfs_dir)
+        conn.close()
+        try:
+            print_page_report(page_report(trimmed_filename))
+        except ImportError:
+            print("Install apsw for a report of the pages queries read")
@@ -0,0 +1,221 @@
+# STL
+import os
+import json
+import sqlite3
+import argparse
+from typing import TypedDict
+
+# LOCAL
+from sonamute.site_queries import query_params, applicable_queries
+
+# sql.js-httpvfs fetches the db in pieces of this size, which must be a multiple
+# of its page size; see https://github.com/phiresky/sql.js-httpvfs
+SERVER_CHUNK_SIZE = 25 * 1024 * 1024
+URL_PREFIX = "tp."
+SUFFIX_LENGTH = 3
+
+# how many terms, spread evenly by text, the page report runs each query for
+REPORT_SAMPLES = 20
+
+
+class HttpvfsConfig(TypedDict):
+    serverMode: str
+    requestChunkSize: int
+    databaseLengthBytes: int
+    serverChunkSize: int
+    urlPrefix: str
+    suffixLength: int
+
+
+class PageStats(TypedDict):
+    # means over every sampled term
+    pages: float
+    requests: float
+    max_pages: int
+
+
+def relayout_term_ids(conn: sqlite3.Connection):
+    """
+    Renumber every term by length, then by all time hits, most first.
+
+    Frequency tables are keyed by term id first, so this puts terms which are
+    looked at together, such as the most common ones, in neighboring pages.
+    The tables are only densely packed again by a VACUUM.
+    """
+    # foreign keys can only be toggled outside of a transaction
+    _ = conn.execute("PRAGMA foreign_keys = OFF")
+    _ = conn.execute("BEGIN")
+    try:
+        _ = conn.execute(
+            """
+        CREATE TEMP TABLE term_layout (
+            old INTEGER NOT NULL,
+            new INTEGER NOT NULL,
+            PRIMARY KEY (old)
+        );
+        """
+        )
+        _ = conn.execute(
+            """
+        INSERT INTO term_layout (old, new)
+        SELECT term.id, row_number() OVER (
+            ORDER BY term.len, coalesce(yearly.hits, 0) DESC, term.text
+        )
+        FROM term
+        LEFT JOIN yearly
+        ON yearly.term_id = term.id AND yearly.attr = 0 AND yearly.day = 0
+        """
+        )
+        # negated first, so no renumbered id can collide with an old one
+        for table, column in (
+            ("term", "id"),
+            ("monthly", "term_id"),
+            ("yearly", "term_id"),
+            ("monthly_rank", "term_id"),
+            ("yearly_rank", "term_id"),
+        ):
+            _ = conn.execute(
+                f"""
+            UPDATE {table} SET {column} = -(
+                SELECT new FROM term_layout WHERE old = {table}.{column}
+            )
+            """
+            )
+            _ = conn.execute(f"UPDATE {table} SET {column} = -{column}")
+        _ = conn.execute("DROP TABLE term_layout")
+        _ = conn.execute("COMMIT")
+    except BaseException:
+        _ = conn.execute("ROLLBACK")
+        raise
+    finally:
+        _ = conn.execute("PRAGMA foreign_keys = ON")
+
+
+def chunk_database(
+    filename: str,
+    outdir: str,
+    server_chunk_size: int = SERVER_CHUNK_SIZE,
+) -> HttpvfsConfig:
+    """Split `filename` into chunks for sql.js-httpvfs, with its `config.json`."""
+    conn = sqlite3.connect(filename)
+    page_size: int = conn.execute("PRAGMA page_size").fetchone()[0]
+    conn.close()
+    if server_chunk_size % page_size:
+        raise ValueError(
+            f"Chunk size {server_chunk_size} is not a multiple of page size {page_size}"
+        )
+
+    os.makedirs(outdir, exist_ok=True)
+    for file in os.listdir(outdir):
+        if file.startswith(URL_PREFIX):
+            os.remove(os.path.join(outdir, file))
+
+    with open(filename, "rb") as f:
+        i = 0
+        while chunk := f.read(server_chunk_size):
+            chunk_file = f"{URL_PREFIX}{i:0{SUFFIX_LENGTH}d}"
+            with open(os.path.join(outdir, chunk_file), "wb") as out:
+                _ = out.write(chunk)
+            i += 1
+
+    config: HttpvfsConfig = {
+        "serverMode": "chunked",
+        "requestChunkSize": page_size,
+        "databaseLengthBytes": os.path.getsize(filename),
+        "serverChunkSize": server_chunk_size,
+        "urlPrefix": URL_PREFIX,
+        "suffixLength": SUFFIX_LENGTH,
+    }
+    with open(os.path.join(outdir, "config.json"), "w") as f:
+        _ = f.write(json.dumps(config, indent=4))
+    return config
+
+
+def sample_terms(filename: str, samples: int = REPORT_SAMPLES) -> list[str]:
+    conn = sqlite3.connect(filename)
+    try:
+        count: int = conn.execute("SELECT count(*) FROM term").fetchone()[0]
+        step = max(count // samples, 1)
+        rows = conn.execute(
+            """
+        SELECT text FROM (
+            SELECT text, row_number() OVER (ORDER BY text) - 1 AS i FROM term
+        )
+        WHERE i % ? = 0
+        LIMIT ?
+        """,
+            (step, samples),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [text for (text,) in rows]
+
+
+def page_report(
+    filename: str,
+    samples: int = REPORT_SAMPLES,
+) -> dict[str, PageStats]:
+    """
+    Pages each applicable query of `SITE_QUERIES` reads from `filename`, and how
+    many runs of adjacent pages they make up, standing in for range requests.
+
+    Needs `apsw`, from the `httpvfs` optional dependencies.
+    """
+    # LOCAL
+    from sonamute.pagecount import PageCountVFS, count_runs, measure_query
+
+    vfs = PageCountVFS()
+    report: dict[str, PageStats] = dict()
+    params = [query_params(text) for text in sample_terms(filename, samples)]
+    for name, query in applicable_queries(filename).items():
+        pages = [measure_query(vfs, filename, query, p)["pages"] for p in params]
+        report[name] = {
+            "pages": sum(len(p) for p in pages) / max(len(pages), 1),
+            "requests": sum(count_runs(p) for p in pages) / max(len(pages), 1),
+            "max_pages": max((len(p) for p in pages), default=0),
+        }
+    vfs.unregister()
+    return report
+
+
+def print_page_report(report: dict[str, PageStats]):
+    for name, stats in report.items():
+        print(
+            f"{name}: {stats['pages']:.1f} pages in {stats['requests']:.1f} "
+            f"requests on average, at most {stats['max_pages']} pages"
+        )
+
+
+def main(argv: argparse.Namespace):
+    config = chunk_database(argv.database, argv.outdir)
+    print(f"Wrote {argv.database} to {argv.outdir} as {config}")
+    if argv.report:
+        print_page_report(page_report(argv.database))
+
+
+if __name__ == "__main__":
+
+    def existing_file(file_path: str) -> str:
+        if os.path.isfile(file_path):
+            return file_path
+        raise FileNotFoundError(file_path)
+
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "database",
+        help="SQLite database to serve with sql.js-httpvfs",
+        type=existing_file,
+    )
+    _ = parser.add_argument(
+        "outdir",
+        help="Directory to write the chunks and config.json to",
+    )
+    _ = parser.add_argument(
+        "--report",
+        help="Also report the pages typical queries read (needs apsw)",
+        action="store_true",
+    )
+
+    argv = parser.parse_args()
+
+    main(argv)
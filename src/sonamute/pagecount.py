@@ -0,0 +1,84 @@
+# STL
+import time
+from typing import Any, TypedDict
+
+# PDM
+import apsw
+
+
+class PageCountVFS(apsw.VFS):
+    """
+    Pass-through VFS recording every read of a main database file, much like
+    sql.js-httpvfs turns them into range requests.
+    """
+
+    def __init__(self, name: str = "pagecount"):
+        self.name: str = name
+        # (offset, amount) of every read, in order
+        self.reads: list[tuple[int, int]] = list()
+        super().__init__(name, "")
+
+    def xOpen(self, name: Any, flags: list[int]) -> "PageCountFile":
+        return PageCountFile(self, name, flags)
+
+
+class PageCountFile(apsw.VFSFile):
+    def __init__(self, vfs: PageCountVFS, name: Any, flags: list[int]):
+        self.vfs: PageCountVFS = vfs
+        self.is_main: bool = bool(flags[0] & apsw.SQLITE_OPEN_MAIN_DB)
+        super().__init__("", name, flags)
+
+    def xRead(self, amount: int, offset: int) -> bytes:
+        if self.is_main:
+            self.vfs.reads.append((offset, amount))
+        return super().xRead(amount, offset)
+
+
+class QueryReads(TypedDict):
+    pages: list[int]
+    # read from the file, which is less than whole pages for some reads
+    bytes: int
+    seconds: float
+
+
+def pages_touched(reads: list[tuple[int, int]], page_size: int) -> list[int]:
+    """Every distinct page number covered by `reads`, in ascending order."""
+    pages: set[int] = set()
+    for offset, amount in reads:
+        first = offset // page_size
+        last = (offset + max(amount, 1) - 1) // page_size
+        pages.update(range(first, last + 1))
+    return sorted(pages)
+
+
+def count_runs(pages: list[int]) -> int:
+    """Number of runs of consecutive pages, each one range request at best."""
+    return sum(1 for i, page in enumerate(pages) if i == 0 or pages[i - 1] != page - 1)
+
+
+def measure_query(
+    vfs: PageCountVFS,
+    filename: str,
+    query: str,
+    params: dict[str, Any],
+) -> QueryReads:
+    """Run `query` on a cold, read only connection, recording what it read."""
+    vfs.reads.clear()
+    conn = apsw.Connection(filename, flags=apsw.SQLITE_OPEN_READONLY, vfs=vfs.name)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchall()[0][0]
+        # a browser loads the schema once per page load, not once per query
+        _ = conn.execute("SELECT count(*) FROM sqlite_schema").fetchall()
+        vfs.reads.clear()
+        start = time.perf_counter()
+        _ = conn.execute(query, params).fetchall()
+        seconds = time.perf_counter() - start
+    finally:
+        conn.close()
+    # sqlite rereads the header on the first page to check for changes
+    reads = [(offset, amount) for offset, amount in vfs.reads if offset >= page_size]
+    return {
+        "pages": pages_touched(reads, page_size),
+        "bytes": sum(amount for _, amount in reads),
+        "seconds": seconds,
+    }
@@ -0,0 +1,127 @@
+# STL
+import os
+import shutil
+import sqlite3
+
+# PDM
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# LOCAL
+from sonamute.gen_sqlite import FREQ_TABLES, TOTAL_TABLES
+
+PARQUET_COMPRESSION = "zstd"
+# rows read from sqlite and written out at once, as one row group
+PARQUET_ROW_GROUP = 250_000
+# every partition is written whole by one run, so it holds a single part
+PART_NAME = "part-0.parquet"
+# appended to the output directory for the copy being built, and for the old
+# copy while the new one takes its place
+BUILDING_SUFFIX = ".building"
+REPLACED_SUFFIX = ".replaced"
+
+FREQ_SCHEMA = pa.schema(
+    [
+        ("term_id", pa.int64()),
+        ("attr", pa.int8()),
+        ("day", pa.int64()),
+        ("hits", pa.int64()),
+        ("authors", pa.int64()),
+    ]
+)
+TOTAL_SCHEMA = pa.schema(
+    [
+        ("day", pa.int64()),
+        ("term_len", pa.int8()),
+        ("attr", pa.int8()),
+        ("hits", pa.int64()),
+        ("authors", pa.int64()),
+    ]
+)
+TERM_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("len", pa.int8()),
+        ("text", pa.string()),
+    ]
+)
+
+
+def write_rows(cursor: sqlite3.Cursor, schema: pa.Schema, path: str):
+    """Write every row of `cursor` to `path` in row groups, if there are any."""
+    writer: pq.ParquetWriter | None = None
+    while rows := cursor.fetchmany(PARQUET_ROW_GROUP):
+        if writer is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION)
+        columns = list(zip(*rows))
+        batch = pa.Table.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema,
+        )
+        writer.write_table(batch)
+    if writer is not None:
+        writer.close()
+
+
+def export_parquet(filename: str, outdir: str):
+    """
+    Copy the term, frequency, and totals data of the finished SQLite export
+    `filename` to hive partitioned parquet in `outdir`:
+
+    - `{table}/term_len={n}/part-0.parquet` for monthly and yearly
+    - `{total_table}/part-0.parquet` for the totals
+    - `term.parquet`
+
+    The copy is rebuilt whole from `filename` every time, so it holds exactly
+    what the SQLite export does after a resumed or updated run. It is built
+    next to `outdir`, which it then replaces with two renames, so a run that
+    fails while building leaves the old copy as it was.
+    """
+    outdir = os.path.normpath(outdir)
+    building = f"{outdir}{BUILDING_SUFFIX}"
+    replaced = f"{outdir}{REPLACED_SUFFIX}"
+    # left by a run that failed
+    if os.path.exists(building):
+        shutil.rmtree(building)
+    if os.path.exists(replaced):
+        if os.path.exists(outdir):
+            shutil.rmtree(replaced)
+        else:
+            os.rename(replaced, outdir)
+
+    conn = sqlite3.connect(filename)
+    try:
+        term_lens = [n for (n,) in conn.execute("SELECT DISTINCT len FROM term")]
+        for table in FREQ_TABLES:
+            for term_len in term_lens:
+                cursor = conn.execute(
+                    f"""
+                    SELECT f.term_id, f.attr, f.day, f.hits, f.authors
+                    FROM {table} f JOIN term ON term.id = f.term_id
+                    WHERE term.len = ?
+                    ORDER BY f.term_id, f.attr, f.day
+                    """,
+                    (term_len,),
+                )
+                path = os.path.join(building, table, f"term_len={term_len}", PART_NAME)
+                write_rows(cursor, FREQ_SCHEMA, path)
+        for table in TOTAL_TABLES:
+            cursor = conn.execute(
+                f"""
+                SELECT day, term_len, attr, hits, authors FROM {table}
+                ORDER BY day, term_len, attr
+                """
+            )
+            write_rows(cursor, TOTAL_SCHEMA, os.path.join(building, table, PART_NAME))
+        cursor = conn.execute("SELECT id, len, text FROM term ORDER BY id")
+        write_rows(cursor, TERM_SCHEMA, os.path.join(building, "term.parquet"))
+    finally:
+        conn.close()
+
+    os.makedirs(building, exist_ok=True)
+    if os.path.exists(outdir):
+        os.rename(outdir, replaced)
+    os.rename(building, outdir)
+    if os.path.exists(replaced):
+        shutil.rmtree(replaced)
@@ -0,0 +1,148 @@
+# STL
+import sqlite3
+from typing import Literal
+from datetime import UTC, datetime
+from functools import lru_cache
+
+# LOCAL
+from sonamute.smtypes import ATTRIBUTE_IDS, Attribute
+from sonamute.term_search import wildcard_query
+
+# results kept per method of each reader
+READER_CACHE_SIZE = 4096
+# statements sqlite3 keeps prepared per connection
+READER_STATEMENTS = 64
+
+# day, hits, authors
+Point = tuple[datetime, int, int]
+# text, hits, authors
+Ranked = tuple[str, int, int]
+
+TERM_ID_SELECT = "SELECT id FROM term WHERE text = ?"
+SERIES_SELECT = """
+SELECT day, hits, authors FROM %s
+WHERE term_id = ? AND attr = ?
+ORDER BY day
+"""
+RANKED_SELECT = """
+SELECT text, hits, authors FROM %s_rank
+JOIN term ON term.id = %s_rank.term_id
+WHERE term_len = ? AND attr = ? AND day = ?
+ORDER BY rank
+LIMIT ?
+"""
+UNRANKED_SELECT = """
+SELECT text, hits, authors FROM %s
+JOIN term ON term.id = %s.term_id
+WHERE term.len = ? AND attr = ? AND day = ?
+ORDER BY hits DESC, authors DESC, text
+LIMIT ?
+"""
+TOTALS_SELECT = """
+SELECT day, hits, authors FROM %s
+WHERE term_len = ? AND attr = ?
+ORDER BY day
+"""
+
+
+def to_dt(day: int) -> datetime:
+    return datetime.fromtimestamp(day, tz=UTC)
+
+
+class FreqReader:
+    """
+    Read only queries over a database written by `FreqDB`, either export.
+
+    Statements stay prepared on the connection, and results are cached per
+    reader, so repeated lookups don't touch the db. Results are tuples, so
+    callers can't alter what is cached.
+    """
+
+    def __init__(self, database_file: str, mmap_size: int = 0):
+        self.db_file: str = database_file
+        self.conn: sqlite3.Connection = sqlite3.connect(
+            f"file:{database_file}?mode=ro",
+            uri=True,
+            cached_statements=READER_STATEMENTS,
+        )
+        if mmap_size:
+            # reads pages straight from the mapped file instead of copying them
+            _ = self.conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        self.tables: set[str] = {name for (name,) in rows.fetchall()}
+
+        # built here rather than on the methods, which would share one cache
+        # between every reader and keep each reader alive through it
+        self.term_id = lru_cache(maxsize=READER_CACHE_SIZE)(self._term_id)
+        self.series = lru_cache(maxsize=READER_CACHE_SIZE)(self._series)
+        self.top = lru_cache(maxsize=READER_CACHE_SIZE)(self._top)
+        self.totals = lru_cache(maxsize=READER_CACHE_SIZE)(self._totals)
+        self.wildcard = lru_cache(maxsize=READER_CACHE_SIZE)(self._wildcard)
+
+    def close(self):
+        self.clear_cache()
+        self.conn.close()
+
+    def clear_cache(self):
+        for method in (
+            self.term_id,
+            self.series,
+            self.top,
+            self.totals,
+            self.wildcard,
+        ):
+            method.cache_clear()
+
+    def _term_id(self, text: str) -> int | None:
+        row = self.conn.execute(TERM_ID_SELECT, (text,)).fetchone()
+        return row[0] if row else None
+
+    def _series(
+        self,
+        text: str,
+        attr: Attribute = Attribute.All,
+        table: Literal["monthly", "yearly"] = "monthly",
+    ) -> tuple[Point, ...]:
+        """Every period `text` was used in, by start day."""
+        term_id = self.term_id(text)
+        if term_id is None:
+            return tuple()
+        rows = self.conn.execute(SERIES_SELECT % table, (term_id, ATTRIBUTE_IDS[attr]))
+        return tuple((to_dt(day), hits, authors) for day, hits, authors in rows)
+
+    def _top(
+        self,
+        term_len: int,
+        day: datetime,
+        attr: Attribute = Attribute.All,
+        table: Literal["monthly", "yearly"] = "monthly",
+        limit: int = 100,
+    ) -> tuple[Ranked, ...]:
+        """
+        The most used terms of a period, most first.
+
+        Exports with ranking tables are read from those, so at most as many terms
+        as were ranked are returned.
+        """
+        query = UNRANKED_SELECT % (table, table)
+        if f"{table}_rank" in self.tables:
+            query = RANKED_SELECT % (table, table)
+        params = (term_len, ATTRIBUTE_IDS[attr], int(day.timestamp()), limit)
+        return tuple(self.conn.execute(query, params).fetchall())
+
+    def _totals(
+        self,
+        term_len: int,
+        attr: Attribute = Attribute.All,
+        table: Literal["total_monthly", "total_yearly"] = "total_monthly",
+    ) -> tuple[Point, ...]:
+        """Hits and authors across all terms of a length, by period."""
+        rows = self.conn.execute(TOTALS_SELECT % table, (term_len, ATTRIBUTE_IDS[attr]))
+        return tuple((to_dt(day), hits, authors) for day, hits, authors in rows)
+
+    def _wildcard(self, pattern: str, term_len: int | None = None) -> tuple[str, ...]:
+        """Every term matching `pattern`, where `*` is any text."""
+        indexed = "term_search" in self.tables
+        query, params = wildcard_query(pattern, term_len, indexed)
+        rows = self.conn.execute(query, params).fetchall()
+        return tuple(sorted(text for _, text in rows))
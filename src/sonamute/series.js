@@ -0,0 +1,58 @@
+// Decoder for `monthly_series.data`, as written by series.py; the two must be
+// kept in step. Each series is a run of unsigned LEB128 varints: the month
+// index of its first month (months since 1970-01), the number of months, then
+// for every month in order, the change in hits and the change in authors from
+// the month before, zigzag encoded. Months without a row are zeroes.
+//
+// Counts stay far below 2 ** 53, so varints are read with arithmetic instead
+// of bitwise operators, which would truncate them to 32 bits.
+
+// rowid of a term's series for an attribute in `monthly_series`; `SERIES_ATTRS`
+// in series.py
+export function seriesId(termId, attr) {
+  return termId * 8 + attr;
+}
+
+export function monthFromIndex(i) {
+  return new Date(Date.UTC(1970 + Math.floor(i / 12), i % 12, 1));
+}
+
+// the varint at `pos`, and the position after it
+function readVarint(data, pos) {
+  let n = 0;
+  let scale = 1;
+  for (;;) {
+    const byte = data[pos];
+    pos += 1;
+    n += (byte & 0x7f) * scale;
+    if (byte < 0x80) {
+      return [n, pos];
+    }
+    scale *= 0x80;
+  }
+}
+
+function unzigzag(n) {
+  return n % 2 === 0 ? n / 2 : -(n + 1) / 2;
+}
+
+// every month a series covers, including empty ones, as
+// {month: Date, hits: number, authors: number}
+export function decodeSeries(data) {
+  let first, count, delta;
+  let pos = 0;
+  [first, pos] = readVarint(data, pos);
+  [count, pos] = readVarint(data, pos);
+
+  const points = [];
+  let hits = 0;
+  let authors = 0;
+  for (let month = first; month < first + count; month++) {
+    [delta, pos] = readVarint(data, pos);
+    hits += unzigzag(delta);
+    [delta, pos] = readVarint(data, pos);
+    authors += unzigzag(delta);
+    points.push({ month: monthFromIndex(month), hits, authors });
+  }
+  return points;
+}
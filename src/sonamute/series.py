@@ -0,0 +1,128 @@
+# STL
+import os
+import sqlite3
+from datetime import UTC, datetime
+from itertools import groupby
+from collections.abc import Iterable
+
+# decodes series for the website; must be kept in step with `encode_series`
+SERIES_DECODER = os.path.join(os.path.dirname(__file__), "series.js")
+# every attribute id is below this, so each (term_id, attr) has its own id
+SERIES_ATTRS = 8
+
+# Packed monthly series, one BLOB per term and attr, with the id
+# `term_id * SERIES_ATTRS + attr` as its rowid, so finding one is a single walk
+# of the table's B-tree rather than of an index and then the table. Each is a
+# run of unsigned LEB128 varints: the month index of its first month (months since 1970-01),
+# the number of months, then for every month in order, the change in hits and
+# the change in authors from the month before, zigzag encoded. Months without a
+# row are zeroes, so a series covers every month from its first to its last.
+SERIES_CREATE = """
+CREATE TABLE IF NOT EXISTS monthly_series (
+    id INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (id)
+);
+"""
+SERIES_INSERT = "INSERT INTO monthly_series (id, data) VALUES (?, ?)"
+MONTHLY_ROWS_SELECT = """
+SELECT term_id, attr, day, hits, authors FROM monthly
+ORDER BY term_id, attr, day
+"""
+
+# month, hits, authors
+SeriesPoint = tuple[datetime, int, int]
+
+
+def series_id(term_id: int, attr: int) -> int:
+    return term_id * SERIES_ATTRS + attr
+
+
+def month_index(d: datetime) -> int:
+    return (d.year - 1970) * 12 + d.month - 1
+
+
+def month_from_index(i: int) -> datetime:
+    return datetime(1970 + i // 12, i % 12 + 1, 1, tzinfo=UTC)
+
+
+def zigzag(n: int) -> int:
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def unzigzag(n: int) -> int:
+    return n // 2 if not n % 2 else -(n + 1) // 2
+
+
+def write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """Read the varint at `pos`, returning it and the position after it."""
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def encode_series(points: Iterable[tuple[int, int, int]]) -> bytes:
+    """Pack (month index, hits, authors) points, in ascending month order."""
+    by_month = {month: (hits, authors) for month, hits, authors in points}
+    out = bytearray()
+    if not by_month:
+        write_varint(out, 0)
+        write_varint(out, 0)
+        return bytes(out)
+
+    first = min(by_month)
+    count = max(by_month) - first + 1
+    write_varint(out, first)
+    write_varint(out, count)
+    prev_hits = prev_authors = 0
+    for month in range(first, first + count):
+        hits, authors = by_month.get(month, (0, 0))
+        write_varint(out, zigzag(hits - prev_hits))
+        write_varint(out, zigzag(authors - prev_authors))
+        prev_hits, prev_authors = hits, authors
+    return bytes(out)
+
+
+def decode_series(data: bytes) -> list[SeriesPoint]:
+    """Unpack a series into every month it covers, including empty ones."""
+    first, pos = read_varint(data, 0)
+    count, pos = read_varint(data, pos)
+    points: list[SeriesPoint] = list()
+    hits = authors = 0
+    for month in range(first, first + count):
+        delta, pos = read_varint(data, pos)
+        hits += unzigzag(delta)
+        delta, pos = read_varint(data, pos)
+        authors += unzigzag(delta)
+        points.append((month_from_index(month), hits, authors))
+    return points
+
+
+def build_series(conn: sqlite3.Connection):
+    """(Re)build `monthly_series` from every row of `monthly`."""
+    _ = conn.execute(SERIES_CREATE)
+    _ = conn.execute("DELETE FROM monthly_series")
+
+    def series_rows():
+        rows = conn.execute(MONTHLY_ROWS_SELECT)
+        for (term_id, attr), group in groupby(rows, key=lambda r: (r[0], r[1])):
+            points = (
+                (month_index(datetime.fromtimestamp(day, tz=UTC)), hits, authors)
+                for _, _, day, hits, authors in group
+            )
+            yield series_id(term_id, attr), encode_series(points)
+
+    _ = conn.executemany(SERIES_INSERT, series_rows())
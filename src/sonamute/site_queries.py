@@ -0,0 +1,132 @@
+# STL
+import sqlite3
+from typing import Any, TypedDict
+
+# LOCAL
+from sonamute.series import SERIES_ATTRS
+
+
+class SiteQuery(TypedDict):
+    query: str
+    # skipped unless the export has this table, for optional parts
+    needs: str | None
+
+
+# the website's queries, the only list of them; both the page report and the
+# benchmark run each for sampled terms given as `:text`, with `:term_len` its
+# length, `:infix` a LIKE pattern for its middle, and `:prefix` a LIKE pattern
+# for its start
+SITE_QUERIES: dict[str, SiteQuery] = {
+    "term": {
+        "query": "SELECT id, len FROM term WHERE text = :text",
+        "needs": None,
+    },
+    "top_month": {
+        "query": """
+        SELECT rank, text, hits, authors FROM monthly_rank
+        JOIN term ON term.id = monthly_rank.term_id
+        WHERE term_len = :term_len AND attr = 0 AND day = (
+            SELECT max(day) FROM monthly_rank
+            WHERE term_len = :term_len AND attr = 0
+        )
+        ORDER BY rank
+        """,
+        "needs": "monthly_rank",
+    },
+    "top_all_time": {
+        "query": """
+        SELECT rank, text, hits, authors FROM yearly_rank
+        JOIN term ON term.id = yearly_rank.term_id
+        WHERE term_len = :term_len AND attr = 0 AND day = 0
+        ORDER BY rank
+        """,
+        "needs": "yearly_rank",
+    },
+    "top_all_time_unranked": {
+        "query": """
+        SELECT text, hits, authors FROM yearly
+        JOIN term ON term.id = yearly.term_id
+        WHERE term.len = :term_len AND attr = 0 AND day = 0
+        ORDER BY hits DESC
+        LIMIT 100
+        """,
+        "needs": None,
+    },
+    "series_monthly": {
+        "query": """
+        SELECT day, hits, authors FROM monthly
+        JOIN term ON term.id = monthly.term_id
+        WHERE term.text = :text AND attr = 0
+        ORDER BY day
+        """,
+        "needs": None,
+    },
+    "series_packed": {
+        "query": f"""
+        SELECT data FROM monthly_series
+        WHERE id = (SELECT id FROM term WHERE text = :text) * {SERIES_ATTRS} + 0
+        """,
+        "needs": "monthly_series",
+    },
+    "series_yearly": {
+        "query": """
+        SELECT day, hits, authors FROM yearly
+        JOIN term ON term.id = yearly.term_id
+        WHERE term.text = :text AND attr = 0
+        ORDER BY day
+        """,
+        "needs": None,
+    },
+    "wildcard_prefix": {
+        "query": """
+        SELECT id, text FROM term
+        WHERE len = :term_len AND text LIKE :prefix
+        """,
+        "needs": None,
+    },
+    "wildcard_infix": {
+        "query": """
+        SELECT term.id, term.text FROM term_search
+        JOIN term ON term.id = term_search.rowid
+        WHERE term_search.text LIKE :infix
+        """,
+        "needs": "term_search",
+    },
+    "totals_monthly": {
+        "query": """
+        SELECT day, hits, authors FROM total_monthly
+        WHERE term_len = :term_len AND attr = 0
+        ORDER BY day
+        """,
+        "needs": None,
+    },
+}
+
+
+def query_params(text: str) -> dict[str, Any]:
+    middle = len(text) // 2
+    return {
+        "text": text,
+        "term_len": len(text.split()),
+        "infix": f"%{text[max(middle - 1, 0):middle + 2]}%",
+        "prefix": f"{text[:2]}%",
+    }
+
+
+def export_tables(filename: str) -> set[str]:
+    conn = sqlite3.connect(filename)
+    try:
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return {name for (name,) in rows.fetchall()}
+    finally:
+        conn.close()
+
+
+def applicable_queries(filename: str) -> dict[str, str]:
+    """Every query in `SITE_QUERIES` which `filename` has the tables for."""
+    tables = export_tables(filename)
+    return {
+        name: site["query"]
+        for name, site in SITE_QUERIES.items()
+        if not site["needs"] or site["needs"] in tables
+    }
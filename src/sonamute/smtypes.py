@@ -1,7 +1,7 @@
 # STL
 from enum import Enum, IntEnum
 from uuid import UUID
-from typing import TypedDict, NotRequired
+from typing import TypedDict, NamedTuple
 from datetime import datetime
 
 
@@ -37,6 +37,13 @@ class Stats(TypedDict):
 StatsCounter = dict[tuple[int, str, Attribute], Stats]
 
 
+# sqlite generation, merging several periods
+class IndexedStats(TypedDict):
+    hits: int
+    authors: set[int]
+    # authors by their index in CountedAuthors
+
+
 class KnownPlatforms(IntEnum):
     Other = 0  # unsortable
 
@@ -83,12 +90,6 @@ class Sentence(TypedDict):
     score: float
 
 
-class CommSentence(TypedDict):
-    words: list[str]
-    community: UUID
-    author: UUID
-
-
 class SortedSentence(TypedDict):
     words: list[str]
     author: UUID
@@ -121,15 +122,10 @@ class GelFrequency(TypedDict):
 
 
 # sqlite generation
-class SQLTerm(TypedDict):
+class SQLFrequency(NamedTuple):
+    # a tuple so it can be bound as-is once text is swapped for its term id
     text: str
-    len: int
-
-
-class SQLFrequency(TypedDict):
-    # NOTE: exactly one of term or term_id are required.
-    term: SQLTerm
-    term_id: NotRequired[int]
+    term_len: int
     attr: int
     day: int
     hits: int
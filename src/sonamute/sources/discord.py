@@ -115,28 +115,25 @@ class DiscordFetcher(FileFetcher):
         "_id": KnownPlatforms.Discord.value,
         "name": KnownPlatforms.Discord.name,
     }
-    __seen: set[int] = set()
+    __seen: set[int]
 
     @override
     def get_files(self) -> Generator[DiscordJSON, None, None]:
-        for root, _, files in os.walk(self.root):
-            # we don't need dirs
-
-            for filename in files:
-                if not filename.endswith(".json"):
-                    continue
-
-                data = cast(
-                    DiscordJSON, try_load_json_file(os.path.join(root, filename))
-                )
-                if not data:
-                    continue
-                if "messageCount" not in data:
-                    continue
-                yield data
+        for path in self.walk():
+            filename = os.path.basename(path)
+            if not filename.endswith(".json"):
+                continue
+
+            data = cast(DiscordJSON, try_load_json_file(path))
+            if not data:
+                continue
+            if "messageCount" not in data:
+                continue
+            yield data
 
     @override
     def get_messages(self) -> Generator[PreMessage, None, None]:
+        self.__seen = set()
         for f in self.get_files():
             container_id = int(f["channel"]["id"])
             community_id = int(f["guild"]["id"])
@@ -186,5 +183,3 @@ class DiscordFetcher(FileFetcher):
                 }
 
                 yield message
-
-        self.__seen = set()
@@ -123,26 +123,26 @@ class ForumFetcher(FileFetcher):
         "_id": KnownPlatforms.Forum.value,
         "name": KnownPlatforms.Forum.name,
     }
-    __seen: set[int] = set()
+    __seen: set[int]
 
     @override
     def get_files(self) -> Generator[Tag, None, None]:
-        for root, _, files in os.walk(self.root):
-            for filename in files:
-                if not filename.startswith("viewtopic.php"):
-                    continue
+        for path in self.walk():
+            filename = os.path.basename(path)
+            if not filename.startswith("viewtopic.php"):
+                continue
 
-                data = try_load_html_file(os.path.join(root, filename))
-                if not data:
-                    continue
+            data = try_load_html_file(path)
+            if not data:
+                continue
 
-                # there are, at most, 10 posts per page
-                # the content isn't going anywhere, so this is fine
-                posts = data.select(POST_SELECTOR, limit=10)
-                if not posts:
-                    continue
+            # there are, at most, 10 posts per page
+            # the content isn't going anywhere, so this is fine
+            posts = data.select(POST_SELECTOR, limit=10)
+            if not posts:
+                continue
 
-                yield from posts
+            yield from posts
 
     @override
     def get_community(self, raw_src: Tag) -> Community:
@@ -187,6 +187,7 @@ class ForumFetcher(FileFetcher):
 
     @override
     def get_messages(self) -> Generator[PreMessage, None, None]:
+        self.__seen = set()
         for post in self.get_files():
 
             post_id_obj = post.select_one(POST_ID_SELECTOR)
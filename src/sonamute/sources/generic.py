@@ -1,7 +1,8 @@
 # STL
+import os
 from abc import abstractmethod
 from typing import Any
-from collections.abc import Generator
+from collections.abc import Hashable, Generator
 
 # LOCAL
 from sonamute.smtypes import Author, Community, PreMessage
@@ -51,14 +52,30 @@ class PlatformFetcher:
     @abstractmethod
     def get_messages(self) -> Generator[PreMessage, None, None]: ...
 
+    def seen_key(self, msg: PreMessage) -> Hashable:
+        """What `get_messages` skips repeats of a message by"""
+        return msg["_id"]
+
 
 class FileFetcher(PlatformFetcher):
     root: str
+    # when given, only these files are read instead of all of root
+    paths: list[str] | None
 
-    def __init__(self, root: str):
+    def __init__(self, root: str, paths: list[str] | None = None):
         self.root = root
+        self.paths = paths
         super().__init__()
 
+    def walk(self) -> Generator[str, None, None]:
+        """Path of every file under self.root, or of each of self.paths"""
+        if self.paths is not None:
+            yield from self.paths
+            return
+        for root, _, files in os.walk(self.root):
+            for filename in files:
+                yield os.path.join(root, filename)
+
     @abstractmethod
     def get_files(self) -> Generator[Any, None, None]:
         """Use the specified self.root to fetch and open files"""
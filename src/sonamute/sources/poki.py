@@ -71,30 +71,30 @@ class PokiLapoFetcher(FileFetcher):
         "_id": KnownPlatforms.Publication.value,
         "name": KnownPlatforms.Publication.name,
     }
-    __seen: set[int] = set()
+    __seen: set[int]
 
     @override
     def get_files(self) -> Generator[frontmatter.Post, None, None]:
-        for root, _, files in os.walk(self.root):
-            for filename in files:
-                # TODO: safety checking?
-                if not filename.endswith(".md"):
+        for path in self.walk():
+            filename = os.path.basename(path)
+            # TODO: safety checking?
+            if not filename.endswith(".md"):
+                continue
+
+            with open(path, "r") as f:
+                data = frontmatter.loads(f.read())
+                if not data or not data.metadata:
+                    continue
+                data.metadata = cast(Frontmatter, data.metadata)
+                if not data.metadata.get("date"):
+                    continue
+                if data.metadata.get("date-precision") in ("none", "year"):
+                    # we need month precision
+                    continue
+                if not data.content:
                     continue
 
-                with open(os.path.join(root, filename), "r") as f:
-                    data = frontmatter.loads(f.read())
-                    if not data or not data.metadata:
-                        continue
-                    data.metadata = cast(Frontmatter, data.metadata)
-                    if not data.metadata.get("date"):
-                        continue
-                    if data.metadata.get("date-precision") in ("none", "year"):
-                        # we need month precision
-                        continue
-                    if not data.content:
-                        continue
-
-                    yield data
+                yield data
 
     @override
     def get_community(self, raw_src: frontmatter.Post) -> Community:
@@ -129,6 +129,7 @@ class PokiLapoFetcher(FileFetcher):
 
     @override
     def get_messages(self) -> Generator[PreMessage, None, None]:
+        self.__seen = set()
         for msg in self.get_files():
             _id = fake_id(msg.content)
             # file content is stable, but cleaning process may not be
@@ -206,31 +206,31 @@ class RedditFetcher(FileFetcher):
         "_id": KnownPlatforms.Reddit.value,
         "name": KnownPlatforms.Reddit.name,
     }
-    __seen: set[int] = set()
+    __seen: set[int]
 
     @override
     def get_files(self) -> Generator[RedditJSON, None, None]:
-        for root, _, files in os.walk(self.root):
-            for filename in files:
-                if ("comments" not in filename) and ("submissions" not in filename):
-                    continue
-                if filename.endswith(".zst"):
-                    continue
-                # TODO: safety checking?
-                with open(os.path.join(root, filename), "r") as f:
-                    for line in f:
-                        data = cast(RedditJSON, try_load_json(line))
-                        if not data:
-                            continue
-                        # NOTE: ONE COMMENT LACKS AN ID. WHY??
-                        # if "id" not in data:
-                        #     continue
-                        if "subreddit" not in data:
-                            continue
-                        if "subreddit_id" not in data:
-                            continue
-
-                        yield data
+        for path in self.walk():
+            filename = os.path.basename(path)
+            if ("comments" not in filename) and ("submissions" not in filename):
+                continue
+            if filename.endswith(".zst"):
+                continue
+            # TODO: safety checking?
+            with open(path, "r") as f:
+                for line in f:
+                    data = cast(RedditJSON, try_load_json(line))
+                    if not data:
+                        continue
+                    # NOTE: ONE COMMENT LACKS AN ID. WHY??
+                    # if "id" not in data:
+                    #     continue
+                    if "subreddit" not in data:
+                        continue
+                    if "subreddit_id" not in data:
+                        continue
+
+                    yield data
 
     @override
     def get_community(self, raw_src: RedditJSON) -> Community:
@@ -268,6 +268,7 @@ class RedditFetcher(FileFetcher):
 
     @override
     def get_messages(self) -> Generator[PreMessage, None, None]:
+        self.__seen = set()
         for msg in self.get_files():
             # reddit data is line-by-line
             # so get_files emits each line as json here
@@ -179,25 +179,21 @@ class TelegramFetcher(FileFetcher):
         "_id": KnownPlatforms.Telegram.value,
         "name": KnownPlatforms.Telegram.name,
     }
-    __seen: set[str] = set()
+    __seen: set[tuple[int, int]]
 
     @override
     def get_files(self) -> Generator[TelegramJSON, None, None]:
-        for root, _, files in os.walk(self.root):
-            # we don't need dirs
-
-            for filename in files:
-                if not filename.endswith(".json"):
-                    continue
-
-                data = cast(
-                    TelegramJSON, try_load_json_file(os.path.join(root, filename))
-                )
-                if not data:
-                    continue
-                if "name" not in data and "type" not in data:
-                    continue
-                yield data
+        for path in self.walk():
+            filename = os.path.basename(path)
+            if not filename.endswith(".json"):
+                continue
+
+            data = cast(TelegramJSON, try_load_json_file(path))
+            if not data:
+                continue
+            if "name" not in data and "type" not in data:
+                continue
+            yield data
 
     @override
     def get_community(self, raw_src: TelegramJSON) -> Community:
@@ -225,8 +221,13 @@ class TelegramFetcher(FileFetcher):
         }
         return author
 
+    @override
+    def seen_key(self, msg: PreMessage) -> tuple[int, int]:
+        return msg["community"]["_id"], msg["_id"]
+
     @override
     def get_messages(self) -> Generator[PreMessage, None, None]:
+        self.__seen = set()
         for f in self.get_files():
             community = self.get_community(f)
 
@@ -235,7 +236,7 @@ class TelegramFetcher(FileFetcher):
                     continue  # join notifs, channel edits, etc.
 
                 _id = int(m["id"])  # i don't trust it
-                _seen_id = f"{community['_id']}_{_id}"
+                _seen_id = (community["_id"], _id)
                 # telegram IDs are per-chat, so we tack on community_id
                 if _seen_id in self.__seen:
                     continue
@@ -280,5 +281,3 @@ class TelegramFetcher(FileFetcher):
                 }
 
                 yield message
-
-        self.__seen = set()
@@ -195,26 +195,24 @@ class YouTubeFetcher(FileFetcher):
         "_id": KnownPlatforms.YouTube.value,
         "name": KnownPlatforms.YouTube.name,
     }
-    __seen: set[int] = set()
+    __seen: set[int]
 
     @override
     def get_files(self) -> Generator[YouTubeJSON, None, None]:
-        for root, _, files in os.walk(self.root):
-            for filename in files:
-                if not filename.endswith(".json"):
-                    continue
+        for path in self.walk():
+            filename = os.path.basename(path)
+            if not filename.endswith(".json"):
+                continue
 
-                data = cast(
-                    YouTubeJSON, try_load_json_file(os.path.join(root, filename))
-                )
-                if not data:
-                    continue
+            data = cast(YouTubeJSON, try_load_json_file(path))
+            if not data:
+                continue
 
-                # not a video
-                if "formats" not in data:
-                    continue
+            # not a video
+            if "formats" not in data:
+                continue
 
-                yield data
+            yield data
 
     @override
     def get_community(self, raw_src: YouTubeJSON) -> Community:
@@ -273,6 +271,7 @@ class YouTubeFetcher(FileFetcher):
 
     @override
     def get_messages(self) -> Generator[PreMessage, None, None]:
+        self.__seen = set()
         for video in self.get_files():
             video_id = youtube_id_to_int(video["id"])
             community = self.get_community(video)
@@ -0,0 +1,63 @@
+# STL
+import re
+import sqlite3
+
+# FTS5's trigram tokenizer lets LIKE patterns with at least this many literal
+# characters in a row be answered from the index instead of scanning `term`
+TRIGRAM_LEN = 3
+
+# external content; the index holds only trigrams, and reads text from `term`
+TERM_SEARCH_CREATE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS term_search USING fts5(
+    text,
+    content='term',
+    content_rowid='id',
+    tokenize='trigram',
+    detail='none'
+);
+"""
+TERM_SEARCH_REBUILD = "INSERT INTO term_search (term_search) VALUES ('rebuild')"
+
+TERM_SEARCH_SELECT = """
+SELECT term.id, term.text FROM term_search
+JOIN term ON term.id = term_search.rowid
+WHERE term_search.text LIKE ?
+"""
+TERM_LIKE_SELECT = "SELECT term.id, term.text FROM term WHERE term.text LIKE ?"
+
+
+def build_term_search(conn: sqlite3.Connection):
+    """Create the trigram index over `term.text`, or refresh it from `term`."""
+    _ = conn.execute(TERM_SEARCH_CREATE)
+    _ = conn.execute(TERM_SEARCH_REBUILD)
+
+
+def wildcard_to_like(pattern: str) -> str:
+    """Turn a search like `*pona*`, where `*` is any text, into a LIKE pattern."""
+    return pattern.replace("*", "%")
+
+
+def longest_literal(pattern: str) -> int:
+    return max((len(part) for part in re.split(r"[*%_]", pattern)), default=0)
+
+
+def wildcard_query(
+    pattern: str,
+    term_len: int | None = None,
+    indexed: bool = True,
+) -> tuple[str, list[str | int]]:
+    """
+    Query and params finding the id and text of every term matching `pattern`.
+
+    If `indexed`, patterns with enough literal text in a row use `term_search`;
+    the rest fall back to scanning `term`, by length if given.
+    """
+    like = wildcard_to_like(pattern)
+    query = TERM_SEARCH_SELECT
+    if not indexed or longest_literal(like) < TRIGRAM_LEN:
+        query = TERM_LIKE_SELECT
+    params: list[str | int] = [like]
+    if term_len is not None:
+        query += " AND term.len = ?"
+        params.append(term_len)
+    return query, params
@@ -189,3 +189,32 @@ async def gather_batch(
         result = await asyncio.gather(*gatherables)
         results.extend(result)
     return results
+
+
+class MemoryBudget:
+    """
+    Bound the total size of the work in flight between pipeline stages.
+    Each stage acquires the size of what it holds, and the last stage releases it.
+    """
+
+    def __init__(self, limit: int):
+        self.limit: int = limit
+        self.used: int = 0
+        self.cond: asyncio.Condition = asyncio.Condition()
+
+    async def acquire(self, size: int) -> int:
+        """
+        Wait until `size` fits in the budget, then take it.
+        Items larger than the whole budget are clamped so they can run alone.
+        Returns the amount actually taken, which must be passed to `release`.
+        """
+        size = min(size, self.limit)
+        async with self.cond:
+            _ = await self.cond.wait_for(lambda: self.used + size <= self.limit)
+            self.used += size
+        return size
+
+    async def release(self, size: int):
+        async with self.cond:
+            self.used -= size
+            self.cond.notify_all()
@@ -0,0 +1,28 @@
+# LOCAL
+from sonamute.bench import BenchResult, find_regressions
+from sonamute.site_queries import query_params
+
+
+def test_query_params():
+    params = query_params("toki pona")
+    assert params["term_len"] == 2
+    assert params["prefix"] == "to%"
+    assert params["infix"] == "%i p%"
+
+
+def test_find_regressions():
+    baseline: dict[str, BenchResult] = {
+        "series_monthly": {"pages": 10.0, "bytes": 10240.0, "seconds": 0.001},
+        "top_month": {"pages": 4.0, "bytes": 4096.0, "seconds": 0.001},
+    }
+    results: dict[str, BenchResult] = {
+        # within the threshold, and slower, which is not a regression
+        "series_monthly": {"pages": 10.5, "bytes": 10752.0, "seconds": 0.5},
+        "top_month": {"pages": 8.0, "bytes": 4096.0, "seconds": 0.001},
+        "wildcard_infix": {"pages": 100.0, "bytes": 102400.0, "seconds": 0.001},
+    }
+
+    regressions = find_regressions(results, baseline, threshold=0.1)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("top_month: 8.0 pages")
@@ -6,12 +6,16 @@ from uuid import uuid4
 import pytest
 
 # LOCAL
-from sonamute.smtypes import SortedSentence
+from sonamute.smtypes import Attribute, SortedSentence
 from sonamute.counters import (
+    countables,
     window_iter,
     window_iter_terms,
     get_sentence_stats,
+    parallel_sentence_stats,
 )
+from sonamute.sources.reddit import RedditFetcher
+from sonamute.sources.telegram import TelegramFetcher
 
 
 def test_overlapping_ntuples():
@@ -107,3 +111,85 @@ def test_freq_counter_2():
     # dumped = json.dumps(metacounter, indent=2, default=str)
     # print(dumped)
     assert True
+
+
+def test_parallel_sentence_stats(tmp_path):
+    posts = [
+        "mi wile moku e kili. sina pona.",
+        "toki pona li pona tawa mi",
+        "jan pona mi li toki e ni: mi wile moku",
+        "sina sona ala sona e toki pona?",
+    ]
+    for n in range(6):
+        with open(tmp_path / f"comments_{n}.json", "w") as f:
+            for i, body in enumerate(posts):
+                comment = {
+                    "id": f"{n}x{i}",
+                    "subreddit": "tokipona",
+                    "subreddit_id": "t5_2qhz1",
+                    "author": "jan",
+                    "author_fullname": "t2_1",
+                    "created_utc": 1700000000 + i,
+                    "body": body,
+                }
+                _ = f.write(json.dumps(comment) + "\n")
+
+    expected = get_sentence_stats(countables(RedditFetcher(str(tmp_path))), 3)
+    stats = parallel_sentence_stats(RedditFetcher(str(tmp_path)), 3, 2)
+    assert stats == dict(expected)
+    assert list(stats) == list(expected)
+
+
+def test_parallel_sentence_stats_overlap(tmp_path):
+    posts = [
+        "mi wile moku e kili. sina pona.",
+        "toki pona li pona tawa mi",
+        "jan pona mi li toki e ni: mi wile moku",
+    ]
+    for n in range(6):
+        with open(tmp_path / f"comments_{n}.json", "w") as f:
+            # later files repeat the comments of earlier ones, as dumps do
+            for i in range(n, n + 3):
+                comment = {
+                    "id": f"x{i}",
+                    "subreddit": "tokipona",
+                    "subreddit_id": "t5_2qhz1",
+                    "author": "jan",
+                    "author_fullname": "t2_1",
+                    "created_utc": 1700000000 + i,
+                    "body": posts[i % len(posts)],
+                }
+                _ = f.write(json.dumps(comment) + "\n")
+
+    expected = get_sentence_stats(countables(RedditFetcher(str(tmp_path))), 3)
+    stats = parallel_sentence_stats(RedditFetcher(str(tmp_path)), 3, 2)
+    assert stats == dict(expected)
+    assert list(stats) == list(expected)
+    # the 8 distinct comments use "pona" 11 times; repeats aren't counted
+    assert stats[(1, "pona", Attribute.All)]["hits"] == 11
+
+
+def test_parallel_sentence_stats_telegram(tmp_path):
+    # telegram ids are per chat, so both chats' messages are distinct
+    for chat in (1, 2):
+        messages = [
+            {
+                "id": i,
+                "type": "message",
+                "date": "2024-01-01T00:00:00",
+                "date_unixtime": str(1700000000 + i),
+                "from": "jan",
+                "from_id": f"user{chat}",
+                "text": "mi wile toki",
+                "text_entities": [{"type": "plain", "text": "mi wile toki"}],
+            }
+            for i in range(1, 16)
+        ]
+        chat_json = {"name": f"chat {chat}", "type": "private_supergroup", "id": chat}
+        with open(tmp_path / f"chat_{chat}.json", "w") as f:
+            _ = f.write(json.dumps({**chat_json, "messages": messages}))
+
+    expected = get_sentence_stats(countables(TelegramFetcher(str(tmp_path))), 3)
+    stats = parallel_sentence_stats(TelegramFetcher(str(tmp_path)), 3, 2)
+    assert stats == dict(expected)
+    assert stats[(1, "mi", Attribute.All)]["hits"] == 30
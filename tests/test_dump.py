@@ -0,0 +1,37 @@
+# STL
+import json
+from uuid import UUID
+
+# LOCAL
+from sonamute.smtypes import ATTRIBUTE_IDS, Attribute, StatsCounter
+from sonamute.__main__ import dump_stats
+
+
+def authors(n: int) -> set[UUID]:
+    return {UUID(int=i) for i in range(n)}
+
+
+def test_dump_stats(tmp_path):
+    stats: StatsCounter = {
+        (2, "toki pona", Attribute.All): {"hits": 5, "authors": authors(2)},
+        (1, "toki", Attribute.All): {"hits": 9, "authors": authors(3)},
+        (1, "pona", Attribute.All): {"hits": 9, "authors": authors(4)},
+        (1, "mute", Attribute.All): {"hits": 1, "authors": authors(1)},
+        (1, "toki", Attribute.Start): {"hits": 4, "authors": authors(1)},
+    }
+    output = tmp_path / "dump.json"
+    dump_stats(stats, str(output), 2)
+
+    rows = json.loads(output.read_text())
+    assert rows == [
+        {"text": "pona", "term_len": 1, "attr": 0, "hits": 9, "authors": 4},
+        {"text": "toki", "term_len": 1, "attr": 0, "hits": 9, "authors": 3},
+        {
+            "text": "toki",
+            "term_len": 1,
+            "attr": ATTRIBUTE_IDS[Attribute.Start],
+            "hits": 4,
+            "authors": 1,
+        },
+        {"text": "toki pona", "term_len": 2, "attr": 0, "hits": 5, "authors": 2},
+    ]
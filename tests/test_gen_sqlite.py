@@ -0,0 +1,280 @@
+# STL
+import sqlite3
+from pathlib import Path
+from datetime import UTC, datetime
+
+# PDM
+import pytest
+
+# LOCAL
+from sonamute.db import CountedAuthors, format_freq_sqlite
+from sonamute.smtypes import ATTRIBUTE_IDS, Attribute, IndexedStats, SQLFrequency
+from sonamute.gen_sqlite import (
+    TABLE_COLUMNS,
+    freqdb_factory,
+    changed_periods,
+    generate_sqlite,
+    merge_indexed_stats,
+    total_indexed_stats,
+)
+
+MIN_DATE = datetime(2020, 1, 1, tzinfo=UTC)
+MAX_DATE = datetime(2021, 1, 1, tzinfo=UTC)
+DATA_TABLES = [
+    "term",
+    "monthly",
+    "yearly",
+    "monthly_rank",
+    "yearly_rank",
+    "total_monthly",
+    "total_yearly",
+]
+
+
+class FakeEDB:
+    """Stands in for MessageDB, with a few terms used differently every month."""
+
+    async def get_msg_date_range(self) -> tuple[datetime, datetime]:
+        return datetime(2019, 6, 3, tzinfo=UTC), datetime(2021, 2, 3, tzinfo=UTC)
+
+    async def load_counted_authors(self) -> CountedAuthors:
+        return CountedAuthors([])
+
+    def stats(
+        self, term_len: int, attr: Attribute, start: datetime
+    ) -> dict[str, IndexedStats]:
+        n = start.month + ATTRIBUTE_IDS[attr]
+        return {
+            f"toki {term_len}": {"hits": n, "authors": {n % 3}},
+            f"pona {term_len}": {"hits": 2, "authors": {0, 1}},
+            f"mute {term_len} {start.month}": {"hits": 1, "authors": set()},
+        }
+
+    async def select_freq_authors_in_range(
+        self, term_len: int, attr: Attribute, start: datetime, end: datetime
+    ) -> dict[str, IndexedStats]:
+        return self.stats(term_len, attr, start)
+
+    async def select_freqs_in_range(
+        self, term_len: int, attr: Attribute, start: datetime, end: datetime
+    ) -> list[SQLFrequency]:
+        return [
+            format_freq_sqlite(
+                text, term_len, attr, start, s["hits"], len(s["authors"])
+            )
+            for text, s in self.stats(term_len, attr, start).items()
+        ]
+
+    async def total_hits_in_range(
+        self, term_len: int, attr: Attribute, start: datetime, end: datetime
+    ) -> int:
+        return sum(s["hits"] for s in self.stats(term_len, attr, start).values())
+
+    async def total_authors_in_range(
+        self, term_len: int, attr: Attribute, start: datetime, end: datetime
+    ) -> int:
+        return 3
+
+
+async def export(
+    edb: FakeEDB,
+    tmp_path: Path,
+    name: str,
+    max_date: datetime = MAX_DATE,
+    **kwargs,
+) -> str:
+    filename = str(tmp_path / f"{name}.sqlite")
+    trimmed = str(tmp_path / f"{name}-trimmed.sqlite")
+    await generate_sqlite(edb, filename, trimmed, MIN_DATE, max_date, 2, **kwargs)
+    return filename
+
+
+def dump(filename: str) -> dict[str, list[tuple]]:
+    conn = sqlite3.connect(filename)
+    try:
+        return {
+            table: conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3").fetchall()
+            for table in DATA_TABLES
+        }
+    finally:
+        conn.close()
+
+
+def dump_by_text(filename: str) -> dict[str, list[tuple]]:
+    """Every data table, with term ids swapped for their text, which is all
+    that is the same between exports."""
+    conn = sqlite3.connect(filename)
+    try:
+        dumped: dict[str, list[tuple]] = dict()
+        for table in DATA_TABLES[1:]:
+            columns = TABLE_COLUMNS[table].replace("term_id", "term.text")
+            query = f"SELECT {columns} FROM {table}"
+            if "term.text" in columns:
+                query += f" JOIN term ON term.id = {table}.term_id"
+            dumped[table] = sorted(conn.execute(query).fetchall())
+        return dumped
+    finally:
+        conn.close()
+
+
+def test_merge_indexed_stats():
+    jan: dict[str, IndexedStats] = {
+        "toki": {"hits": 3, "authors": {0, 1}},
+        "pona": {"hits": 1, "authors": {2}},
+    }
+    feb: dict[str, IndexedStats] = {
+        "toki": {"hits": 2, "authors": {1, 3}},
+        "mute": {"hits": 5, "authors": set()},
+    }
+
+    merged: dict[str, IndexedStats] = dict()
+    merge_indexed_stats(merged, jan)
+    merge_indexed_stats(merged, feb)
+
+    assert merged["toki"] == {"hits": 5, "authors": {0, 1, 3}}
+    assert merged["pona"] == {"hits": 1, "authors": {2}}
+    assert merged["mute"] == {"hits": 5, "authors": set()}
+
+    # the inputs must not be mutated by later merges
+    assert jan["toki"] == {"hits": 3, "authors": {0, 1}}
+
+
+def test_total_indexed_stats():
+    stats: dict[str, IndexedStats] = {
+        "toki": {"hits": 3, "authors": {0, 1}},
+        "pona": {"hits": 4, "authors": {1, 2}},
+    }
+    assert total_indexed_stats(stats) == (7, 3)
+    assert total_indexed_stats(dict()) == (0, 0)
+
+
+def test_changed_periods():
+    first = datetime(2020, 1, 1, tzinfo=UTC)
+    last = datetime(2021, 2, 10, tzinfo=UTC)
+    since = datetime(2020, 9, 15, tzinfo=UTC)
+
+    monthly_since, yearly_days = changed_periods(first, last, since)
+
+    assert monthly_since == int(datetime(2020, 9, 1, tzinfo=UTC).timestamp())
+    # the epoch from 2019-08 ended before `since`
+    assert yearly_days == [int(datetime(2020, 8, 1, tzinfo=UTC).timestamp()), 0]
+
+
+@pytest.mark.asyncio
+async def test_insert_slice_ranks(tmp_path: Path):
+    filename = str(tmp_path / "export.sqlite")
+    sdb = await freqdb_factory(filename, rank_size=2)
+    freqs = [
+        SQLFrequency("toki", 1, 0, 86400, 10, 3),
+        SQLFrequency("pona", 1, 0, 86400, 30, 2),
+        SQLFrequency("mute", 1, 0, 86400, 10, 4),
+    ]
+    await sdb.insert_slice(freqs, "monthly", (86400, 1, 0, 50, 5), "total_monthly")
+    await sdb.close()
+
+    conn = sqlite3.connect(filename)
+    ranks = conn.execute(
+        """
+    SELECT rank, text, hits FROM monthly_rank
+    JOIN term ON term.id = monthly_rank.term_id
+    WHERE term_len = 1 AND attr = 0 AND day = 86400
+    ORDER BY rank
+    """
+    ).fetchall()
+    # ties on hits go to the term with more authors
+    assert ranks == [(1, "pona", 30), (2, "mute", 10)]
+    progress = conn.execute("SELECT * FROM export_progress").fetchall()
+    assert progress == [("monthly", 1, 0, 86400)]
+
+
+@pytest.mark.asyncio
+async def test_sorted_load_matches_unstaged(tmp_path: Path):
+    unstaged = dump(await export(FakeEDB(), tmp_path, "unstaged"))
+    staged = await export(FakeEDB(), tmp_path, "staged", sorted_load=True)
+    assert dump(staged) == unstaged
+    assert unstaged["monthly"]
+
+    conn = sqlite3.connect(staged)
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master")}
+    assert "monthly_staged" not in tables
+
+
+class FailingEDB(FakeEDB):
+    """Fails partway through an export, after `calls` reads."""
+
+    def __init__(self, calls: int):
+        self.calls = calls
+
+    async def select_freqs_in_range(
+        self, term_len: int, attr: Attribute, start: datetime, end: datetime
+    ) -> list[SQLFrequency]:
+        self.calls -= 1
+        if self.calls < 0:
+            raise RuntimeError("injected failure")
+        return await super().select_freqs_in_range(term_len, attr, start, end)
+
+
+@pytest.mark.asyncio
+async def test_resume_matches_clean_export(tmp_path: Path):
+    clean = dump(await export(FakeEDB(), tmp_path, "clean", workers=2))
+
+    with pytest.raises(ExceptionGroup):
+        _ = await export(FailingEDB(40), tmp_path, "resumed", workers=2)
+    conn = sqlite3.connect(tmp_path / "resumed.sqlite")
+    (written,) = conn.execute("SELECT count(*) FROM export_progress").fetchone()
+    conn.close()
+    assert 0 < written < len(clean["total_monthly"]) + len(clean["total_yearly"])
+
+    resumed = await export(FakeEDB(), tmp_path, "resumed", workers=2)
+    assert dump(resumed) == clean
+
+
+@pytest.mark.asyncio
+async def test_check_params_refuses_mismatch(tmp_path: Path):
+    _ = await export(FakeEDB(), tmp_path, "export")
+    with pytest.raises(ValueError):
+        _ = await export(FakeEDB(), tmp_path, "export", rank_size=5)
+
+    sdb = await freqdb_factory(str(tmp_path / "export.sqlite"))
+    params = await sdb.load_params()
+    with pytest.raises(ValueError):
+        await sdb.check_params({**params, "max_term_len": "3"})
+    await sdb.check_params(params)
+    await sdb.close()
+
+
+@pytest.mark.asyncio
+async def test_since_refuses_rollup(tmp_path: Path):
+    _ = await export(FakeEDB(), tmp_path, "export", rollup=True)
+    with pytest.raises(ValueError):
+        _ = await export(FakeEDB(), tmp_path, "export", rollup=True, since=MAX_DATE)
+
+
+class AuthorlessEDB(FakeEDB):
+    """Refuses to load every author, which only a rollup needs."""
+
+    async def load_counted_authors(self) -> CountedAuthors:
+        raise AssertionError("loaded counted authors outside a rollup")
+
+
+@pytest.mark.asyncio
+async def test_counted_authors_only_for_rollup(tmp_path: Path):
+    _ = await export(AuthorlessEDB(), tmp_path, "export")
+    with pytest.raises(AssertionError):
+        _ = await export(AuthorlessEDB(), tmp_path, "rollup", rollup=True)
+
+
+@pytest.mark.asyncio
+async def test_since_matches_fresh_export(tmp_path: Path):
+    _ = await export(
+        FakeEDB(), tmp_path, "updated", max_date=datetime(2020, 7, 1, tzinfo=UTC)
+    )
+    since = datetime(2020, 6, 15, tzinfo=UTC)
+    updated = await export(FakeEDB(), tmp_path, "updated", since=since)
+    fresh = await export(FakeEDB(), tmp_path, "fresh")
+
+    assert dump_by_text(updated) == dump_by_text(fresh)
+    assert dump_by_text(updated)["monthly"]
+    trimmed = str(tmp_path / "updated-trimmed.sqlite")
+    fresh_trimmed = str(tmp_path / "fresh-trimmed.sqlite")
+    assert dump_by_text(trimmed) == dump_by_text(fresh_trimmed)
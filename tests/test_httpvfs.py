@@ -0,0 +1,67 @@
+# STL
+import os
+import json
+import sqlite3
+from pathlib import Path
+
+# LOCAL
+from sonamute.httpvfs import chunk_database, relayout_term_ids
+from sonamute.gen_sqlite import configure_sqlite
+
+
+def test_relayout_term_ids():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    configure_sqlite(conn)
+    _ = conn.executemany(
+        "INSERT INTO term (id, len, text) VALUES (?, ?, ?)",
+        [(1, 2, "toki pona"), (2, 1, "mute"), (3, 1, "toki"), (4, 1, "pona")],
+    )
+    # all time hits, attr All
+    _ = conn.executemany(
+        "INSERT INTO yearly (term_id, attr, day, hits, authors) VALUES (?, 0, 0, ?, 1)",
+        [(1, 50), (2, 5), (3, 100)],
+    )
+    _ = conn.execute(
+        "INSERT INTO monthly (term_id, attr, day, hits, authors) VALUES (3, 0, 1, 7, 1)"
+    )
+
+    relayout_term_ids(conn)
+
+    terms = conn.execute("SELECT id, text FROM term ORDER BY id").fetchall()
+    assert terms == [(1, "toki"), (2, "mute"), (3, "pona"), (4, "toki pona")]
+    yearly = conn.execute(
+        "SELECT text, hits FROM yearly JOIN term ON term.id = yearly.term_id"
+    ).fetchall()
+    assert sorted(yearly) == [("mute", 5), ("toki", 100), ("toki pona", 50)]
+    monthly = conn.execute("SELECT term_id, hits FROM monthly").fetchall()
+    assert monthly == [(1, 7)]
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_chunk_database(tmp_path: Path):
+    filename = str(tmp_path / "db.sqlite")
+    conn = sqlite3.connect(filename)
+    _ = conn.execute("PRAGMA page_size = 1024")
+    _ = conn.execute("CREATE TABLE t (x TEXT)")
+    _ = conn.executemany("INSERT INTO t VALUES (?)", [("x" * 500,)] * 20)
+    conn.commit()
+    conn.close()
+
+    outdir = str(tmp_path / "chunks")
+    config = chunk_database(filename, outdir, server_chunk_size=4096)
+
+    size = os.path.getsize(filename)
+    chunks = sorted(f for f in os.listdir(outdir) if f.startswith("tp."))
+    assert len(chunks) == -(-size // 4096)
+    assert chunks[0] == "tp.000"
+    content = b""
+    for chunk in chunks:
+        with open(os.path.join(outdir, chunk), "rb") as f:
+            content += f.read()
+    with open(filename, "rb") as f:
+        assert content == f.read()
+
+    with open(os.path.join(outdir, "config.json")) as f:
+        assert json.load(f) == config
+    assert config["requestChunkSize"] == 1024
+    assert config["databaseLengthBytes"] == size
@@ -0,0 +1,80 @@
+# STL
+import sqlite3
+from pathlib import Path
+
+# PDM
+import pytest
+
+# LOCAL
+from tests.test_gen_sqlite import MIN_DATE, FakeEDB, export
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def parquet_rows(parquet_dir: Path, table: str) -> list[tuple]:
+    rows = pq.read_table(parquet_dir / table).to_pylist()
+    if table in ("monthly", "yearly"):
+        return sorted(
+            (r["term_id"], r["attr"], r["day"], r["hits"], r["authors"]) for r in rows
+        )
+    return sorted(
+        (r["day"], r["attr"], r["term_len"], r["hits"], r["authors"]) for r in rows
+    )
+
+
+def sqlite_rows(filename: str, table: str) -> list[tuple]:
+    conn = sqlite3.connect(filename)
+    try:
+        return sorted(conn.execute(f"SELECT * FROM {table}").fetchall())
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_parquet_matches_sqlite(tmp_path: Path):
+    parquet_dir = tmp_path / "parquet"
+    filename = await export(FakeEDB(), tmp_path, "export", parquet_dir=str(parquet_dir))
+
+    for table in ("monthly", "yearly", "total_monthly", "total_yearly"):
+        assert parquet_rows(parquet_dir, table) == sqlite_rows(filename, table)
+    parts = list((parquet_dir / "monthly").glob("term_len=*/*.parquet"))
+    assert sorted(p.parent.name for p in parts) == ["term_len=1", "term_len=2"]
+
+    terms = pq.read_table(parquet_dir / "term.parquet").to_pylist()
+    assert [(t["id"], t["len"], t["text"]) for t in terms] == sqlite_rows(
+        filename, "term"
+    )
+
+
+@pytest.mark.asyncio
+async def test_parquet_update_replaces_old_parts(tmp_path: Path):
+    parquet_dir = tmp_path / "parquet"
+    _ = await export(FakeEDB(), tmp_path, "export", parquet_dir=str(parquet_dir))
+    # left by a run that failed while building its copy
+    (tmp_path / "parquet.building" / "monthly").mkdir(parents=True)
+
+    since = MIN_DATE.replace(month=6)
+    filename = await export(
+        FakeEDB(), tmp_path, "export", parquet_dir=str(parquet_dir), since=since
+    )
+
+    # each partition holds one part, so no period is counted twice
+    for table in ("monthly", "yearly"):
+        for partition in (parquet_dir / table).iterdir():
+            assert len(list(partition.iterdir())) == 1
+        assert parquet_rows(parquet_dir, table) == sqlite_rows(filename, table)
+    assert len(list((parquet_dir / "total_monthly").iterdir())) == 1
+    assert sorted(p.name for p in tmp_path.glob("parquet*")) == ["parquet"]
+
+
+@pytest.mark.asyncio
+async def test_parquet_failure_keeps_old_copy(tmp_path: Path):
+    # LOCAL
+    from sonamute.parquet import export_parquet
+
+    parquet_dir = tmp_path / "parquet"
+    filename = await export(FakeEDB(), tmp_path, "export", parquet_dir=str(parquet_dir))
+    with pytest.raises(sqlite3.OperationalError):
+        export_parquet(str(tmp_path / "empty.sqlite"), str(parquet_dir))
+    for table in ("monthly", "yearly", "total_monthly", "total_yearly"):
+        assert parquet_rows(parquet_dir, table) == sqlite_rows(filename, table)
@@ -0,0 +1,78 @@
+# STL
+from pathlib import Path
+from datetime import UTC, datetime
+
+# PDM
+import pytest
+
+# LOCAL
+from sonamute.reader import FreqReader
+from sonamute.smtypes import SQLFrequency
+from sonamute.gen_sqlite import freqdb_factory
+
+JAN = datetime(2024, 1, 1, tzinfo=UTC)
+FEB = datetime(2024, 2, 1, tzinfo=UTC)
+
+
+async def make_export(filename: str):
+    sdb = await freqdb_factory(filename, rank_size=1)
+    for day, freqs in [
+        (JAN, [("toki", 10, 3), ("pona", 30, 2)]),
+        (FEB, [("toki", 12, 4), ("tonsi", 1, 1)]),
+    ]:
+        ts = int(day.timestamp())
+        data = [
+            SQLFrequency(text, 1, 0, ts, hits, authors) for text, hits, authors in freqs
+        ]
+        hits = sum(f.hits for f in data)
+        await sdb.insert_slice(data, "monthly", (ts, 1, 0, hits, 5), "total_monthly")
+    await sdb.close()
+
+
+@pytest.mark.asyncio
+async def test_freq_reader(tmp_path: Path):
+    filename = str(tmp_path / "export.sqlite")
+    await make_export(filename)
+    reader = FreqReader(filename, mmap_size=2**20)
+
+    assert reader.series("toki") == ((JAN, 10, 3), (FEB, 12, 4))
+    assert reader.series("ala") == ()
+    # only one term was ranked per period
+    assert reader.top(1, JAN, limit=5) == (("pona", 30, 2),)
+    assert reader.totals(1) == ((JAN, 40, 5), (FEB, 13, 5))
+    assert reader.wildcard("to*") == ("toki", "tonsi")
+    assert reader.wildcard("*ons*", term_len=1) == ("tonsi",)
+
+    hits = reader.series.cache_info().hits
+    _ = reader.series("toki")
+    assert reader.series.cache_info().hits == hits + 1
+
+    reader.clear_cache()
+    reader.close()
+
+
+@pytest.mark.asyncio
+async def test_freq_reader_caches(tmp_path: Path):
+    filename = str(tmp_path / "export.sqlite")
+    await make_export(filename)
+    reader = FreqReader(filename)
+    other = FreqReader(filename)
+
+    _ = reader.series("toki")
+    _ = reader.totals(1)
+    assert reader.series.cache_info().currsize == 1
+    # each reader keeps its own results
+    assert other.series.cache_info().currsize == 0
+
+    reader.clear_cache()
+    assert reader.series.cache_info().currsize == 0
+    assert reader.totals.cache_info().currsize == 0
+    # and refills them from the db
+    assert reader.series("toki") == ((JAN, 10, 3), (FEB, 12, 4))
+
+    _ = other.series("toki")
+    reader.close()
+    assert reader.series.cache_info().currsize == 0
+    assert reader.term_id.cache_info().currsize == 0
+    assert other.series.cache_info().currsize == 1
+    other.close()
@@ -0,0 +1,107 @@
+# STL
+import json
+import shutil
+import sqlite3
+import subprocess
+from pathlib import Path
+from datetime import UTC, datetime
+
+# PDM
+import pytest
+
+# LOCAL
+from sonamute.series import (
+    SERIES_ATTRS,
+    SERIES_DECODER,
+    zigzag,
+    unzigzag,
+    series_id,
+    month_index,
+    build_series,
+    decode_series,
+    encode_series,
+    month_from_index,
+)
+from sonamute.gen_sqlite import configure_sqlite
+
+
+def test_zigzag():
+    for n in [0, 1, -1, 2, -2, 63, -64, 1_000_000, -1_000_000]:
+        assert unzigzag(zigzag(n)) == n
+    assert [zigzag(n) for n in [0, -1, 1, -2, 2]] == [0, 1, 2, 3, 4]
+
+
+def test_month_index():
+    d = datetime(2024, 3, 1, tzinfo=UTC)
+    assert month_index(datetime(1970, 1, 1, tzinfo=UTC)) == 0
+    assert month_from_index(month_index(d)) == d
+
+
+def test_series_round_trip():
+    start = month_index(datetime(2019, 11, 1, tzinfo=UTC))
+    # a gap in 2020-01, and hits falling as well as rising
+    points = [(start, 5, 2), (start + 1, 300, 40), (start + 3, 1, 1)]
+    decoded = decode_series(encode_series(points))
+
+    assert decoded == [
+        (datetime(2019, 11, 1, tzinfo=UTC), 5, 2),
+        (datetime(2019, 12, 1, tzinfo=UTC), 300, 40),
+        (datetime(2020, 1, 1, tzinfo=UTC), 0, 0),
+        (datetime(2020, 2, 1, tzinfo=UTC), 1, 1),
+    ]
+    assert decode_series(encode_series([])) == []
+
+
+def test_build_series():
+    conn = sqlite3.connect(":memory:")
+    configure_sqlite(conn)
+    _ = conn.executemany(
+        "INSERT INTO term (id, len, text) VALUES (?, ?, ?)",
+        [(1, 1, "toki"), (2, 1, "pona")],
+    )
+    jan = int(datetime(2024, 1, 1, tzinfo=UTC).timestamp())
+    feb = int(datetime(2024, 2, 1, tzinfo=UTC).timestamp())
+    _ = conn.executemany(
+        "INSERT INTO monthly (term_id, attr, day, hits, authors) VALUES (?, ?, ?, ?, ?)",
+        [(1, 0, jan, 10, 3), (1, 0, feb, 12, 4), (1, 1, feb, 2, 1), (2, 0, jan, 7, 2)],
+    )
+
+    build_series(conn)
+
+    rows = conn.execute("SELECT id, data FROM monthly_series").fetchall()
+    series = {divmod(id, SERIES_ATTRS): decode_series(data) for id, data in rows}
+    assert series == {
+        (1, 0): [
+            (datetime(2024, 1, 1, tzinfo=UTC), 10, 3),
+            (datetime(2024, 2, 1, tzinfo=UTC), 12, 4),
+        ],
+        (1, 1): [(datetime(2024, 2, 1, tzinfo=UTC), 2, 1)],
+        (2, 0): [(datetime(2024, 1, 1, tzinfo=UTC), 7, 2)],
+    }
+    assert conn.execute(
+        "SELECT data FROM monthly_series WHERE id = ?", (series_id(1, 1),)
+    ).fetchone() == (rows[1][1],)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_js_decoder_matches():
+    start = month_index(datetime(2019, 11, 1, tzinfo=UTC))
+    # large enough that 32 bit arithmetic would overflow
+    points = [(start, 5, 2), (start + 1, 3_000_000_000, 40), (start + 3, 1, 1)]
+    data = encode_series(points)
+    script = f"""
+    import {{ decodeSeries }} from "{Path(SERIES_DECODER).as_uri()}";
+    const points = decodeSeries(Buffer.from("{data.hex()}", "hex"));
+    console.log(JSON.stringify(points.map((p) => [p.month.getTime(), p.hits, p.authors])));
+    """
+    result = subprocess.run(
+        ["node", "--input-type=module", "-e", script],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    decoded = [
+        (datetime.fromtimestamp(ms / 1000, tz=UTC), hits, authors)
+        for ms, hits, authors in json.loads(result.stdout)
+    ]
+    assert decoded == decode_series(data)
@@ -0,0 +1,47 @@
+# STL
+import sqlite3
+
+# LOCAL
+from sonamute.gen_sqlite import configure_sqlite
+from sonamute.term_search import (
+    TERM_LIKE_SELECT,
+    TERM_SEARCH_SELECT,
+    wildcard_query,
+    build_term_search,
+)
+
+TERMS = ["toki", "pona", "toki pona", "mute", "pona mute", "ona"]
+
+
+def make_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    configure_sqlite(conn)
+    _ = conn.executemany(
+        "INSERT INTO term (id, len, text) VALUES (?, ?, ?)",
+        [(i, len(text.split()), text) for i, text in enumerate(TERMS, start=1)],
+    )
+    build_term_search(conn)
+    return conn
+
+
+def test_wildcard_query_picks_index():
+    query, params = wildcard_query("*pona*")
+    assert query == TERM_SEARCH_SELECT
+    assert params == ["%pona%"]
+
+    query, params = wildcard_query("*na", term_len=1)
+    assert query.startswith(TERM_LIKE_SELECT)
+    assert params == ["%na", 1]
+
+
+def test_wildcard_query_results():
+    conn = make_db()
+    for pattern, term_len, expected in [
+        ("*pona*", None, {"pona", "toki pona", "pona mute"}),
+        ("*pona*", 2, {"toki pona", "pona mute"}),
+        ("*ute", None, {"mute", "pona mute"}),
+        ("*na", 1, {"pona", "ona"}),
+    ]:
+        query, params = wildcard_query(pattern, term_len)
+        found = {text for _, text in conn.execute(query, params).fetchall()}
+        assert found == expected, pattern
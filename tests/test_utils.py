@@ -8,6 +8,7 @@ import pytest
 
 # LOCAL
 from sonamute.utils import (
+    MemoryBudget,
     batch_iter,
     gather_batch,
     days_in_range,
@@ -140,3 +141,23 @@ async def test_gather_batch():
     assert results
     assert len(results) == 100
     assert results == sorted(results)  # because the input was ordered
+
+
+@pytest.mark.asyncio
+async def test_memory_budget():
+    budget = MemoryBudget(10)
+    taken = await budget.acquire(6)
+    assert taken == 6
+
+    # does not fit until the first item is released
+    waiter = asyncio.create_task(budget.acquire(6))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    await budget.release(taken)
+    assert await waiter == 6
+    await budget.release(6)
+
+    # oversized items are clamped so they can run alone
+    assert await budget.acquire(25) == 10
+    assert budget.used == budget.limit